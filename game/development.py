@@ -15,6 +15,16 @@ DATABASES = {
     }
 }
 
+# no memcache needed to run locally.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# build the test database from the models; the old South migrations don't all run on sqlite.
+SOUTH_TESTS_MIGRATE = False
+
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
 
 STATIC_URL = "/static/"
@@ -1,4 +1,7 @@
+from django.core.cache import cache
 from django.db import models
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 
 class DatesMixin(models.Model):
     """Used to track the datetimes the object was created or modified.  Most every model should include this mixin."""
@@ -6,4 +9,18 @@ class DatesMixin(models.Model):
     modified_at = models.DateTimeField(auto_now_add=True, auto_now=True)
     
     class Meta:
-        abstract = True
\ No newline at end of file
+        abstract = True
+
+class ActivityEntryMixin(object):
+    """For rows shown as entries in the activity log.  They never change once written, so each one is rendered once and
+    the markup cached under its dom_id; the "how long ago" label is worked out in the browser from the timestamp in it."""
+    HTML_SECONDS = 60 * 60
+    
+    @property
+    def html(self):
+        key = 'game:activity_html:{dom_id}'.format(dom_id=self.dom_id)
+        html = cache.get(key)
+        if html is None:
+            html = render_to_string('player/activity_log_entry.html', {'activity':self}).replace("\t","").replace("\n", "")
+            cache.set(key, html, self.HTML_SECONDS)
+        return mark_safe(html)
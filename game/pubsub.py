@@ -0,0 +1,102 @@
+"""
+A small publish/subscribe layer on top of the cache.  Publishers store the newest value for a key (usually the id of
+the newest row) and wake up any subscribers waiting on it in the same process.  Changes published by other processes
+are picked up by one poller per process, which reads every key anybody in the process is waiting on with a single
+get_many each LONG_POLL_INTERVAL seconds; waiting requests themselves never touch the cache while they wait.
+
+That matters with cooperative (gevent) workers, where the memcache client blocks the whole worker for each round trip:
+a thousand held requests cost one round trip a second, not two thousand.  Waiting also gives up the request's database
+connections, so held requests don't mean open connections either.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+
+import logging, os, threading, time
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_waiters = {} # key -> set of waiters.
+_poller = {'pid': None}
+
+class _Waiter(object):
+    def __init__(self, seen):
+        self.seen = seen
+        self.changed = threading.Event()
+
+    def check(self, values):
+        if any(values.get(key) != value for key, value in self.seen.items()):
+            self.changed.set()
+
+def publish(key, value, timeout):
+    cache.set(key, value, timeout)
+    with _lock:
+        waiters = list(_waiters.get(key, ()))
+    for waiter in waiters:
+        waiter.check({key: value})
+
+def snapshot(keys):
+    """{key: value} for keys as the cache has them now (None when missing), to wait on with wait()."""
+    values = cache.get_many(keys)
+    return dict((key, values.get(key)) for key in keys)
+
+def _close_connections():
+    # django opens a new connection on the next query.  connections inside a managed transaction are left alone.
+    for alias in connections:
+        if not transaction.is_managed(using=alias):
+            connections[alias].close()
+
+def _poll_once():
+    """Check every key anybody in this process is waiting on, with one get_many, and wake whoever it has changed for."""
+    with _lock:
+        keys = list(_waiters)
+    if not keys:
+        return
+    values = cache.get_many(keys)
+    values = dict((key, values.get(key)) for key in keys)
+    with _lock:
+        waiters = set(waiter for key in keys for waiter in _waiters.get(key, ()))
+    for waiter in waiters:
+        waiter.check(values)
+
+def _poll():
+    while True:
+        try:
+            _poll_once()
+        except Exception:
+            logger.exception('pubsub: polling the cache failed.')
+        time.sleep(settings.LONG_POLL_INTERVAL)
+
+def _start_poller():
+    # started on first use in each process, so a poller started before a fork isn't relied on in the child.
+    with _lock:
+        if _poller['pid'] == os.getpid():
+            return
+        _poller['pid'] = os.getpid()
+    thread = threading.Thread(target=_poll, name='pubsub-poller')
+    thread.daemon = True
+    thread.start()
+
+def wait(seen, timeout):
+    """Block until one of the keys in seen (from snapshot()) holds a different value, or timeout seconds pass.  Returns
+    whether it changed."""
+    if timeout <= 0:
+        return snapshot(seen.keys()) != seen
+    _start_poller()
+    waiter = _Waiter(seen)
+    with _lock:
+        for key in seen:
+            _waiters.setdefault(key, set()).add(waiter)
+    try:
+        waiter.check(snapshot(seen.keys())) # anything published between the snapshot and now.
+        if not waiter.changed.is_set():
+            _close_connections()
+            waiter.changed.wait(timeout)
+        return waiter.changed.is_set()
+    finally:
+        with _lock:
+            for key in seen:
+                _waiters[key].discard(waiter)
+                if not _waiters[key]:
+                    del _waiters[key]
@@ -39,6 +39,10 @@ CACHES = {
   }
 }
 
+# sessions are read from the cache, so a request answered from the cache alone (a 304 from the activity log) doesn't
+# have to touch the database just to find out who is asking.
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
 TEMPLATE_CONTEXT_PROCESSORS = (
     "django.contrib.auth.context_processors.auth",
     "django.core.context_processors.debug",
@@ -54,6 +58,36 @@ LOGIN_REDIRECT_URL = '/world/worldmap/1/main.html'
 LOGIN_URL = 'django.contrib.auth.views.login'
 LOGOUT_URL = 'django.contrib.auth.views.logout'
 
+# How many squares around the player the map page renders.  None renders the whole map.
+MAP_VIEWPORT_RADIUS = 7
+
+# Player heartbeats are kept in the cache; here_since is only written to the database when it is older than this.
+HEARTBEAT_FLUSH_SECONDS = 60
+
+# How many squares away players can see each other on the map and see each other come and go.
+VIEW_RADIUS = 3
+
+# The most turns of terrain a player can cross in one "travel to" or queued move.
+MAX_TRAVEL_TURNS = 50
+
+# The activity long-poll holds a request for up to LONG_POLL_TIMEOUT seconds.  News from other processes is picked up
+# from the cache every LONG_POLL_INTERVAL seconds, once per process however many requests are waiting.
+LONG_POLL_TIMEOUT = 25
+LONG_POLL_INTERVAL = 1
+
+# The activity event stream ends after ACTIVITY_STREAM_SECONDS (browsers reconnect and carry on from Last-Event-ID) and
+# sends a comment every STREAM_KEEPALIVE_SECONDS so proxies don't drop a quiet connection.
+ACTIVITY_STREAM_SECONDS = 5 * 60
+STREAM_KEEPALIVE_SECONDS = 15
+
+# Seen activity and old square events are deleted every ACTIVITY_RETENTION_SECONDS from a background thread in each web
+# process (only one process does it each time).  Set it to 0 to turn that off if the purge_activity_log command is
+# scheduled instead.
+ACTIVITY_RETENTION_SECONDS = int(os.environ.get('ACTIVITY_RETENTION_SECONDS', 5 * 60))
+
+# 'canvas' draws the map in the browser from the json map data, 'html' renders it on the server.
+MAP_RENDERER = 'canvas'
+
 TASTYPIE_FULL_DEBUG = True
 API_LIMIT_PER_PAGE = 10
 
@@ -27,6 +27,11 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "game.settings")
 from django.core.wsgi import get_wsgi_application
 application = get_wsgi_application()
 
+from django.conf import settings
+if settings.ACTIVITY_RETENTION_SECONDS:
+    from players import retention
+    retention.start_scheduler(settings.ACTIVITY_RETENTION_SECONDS)
+
 # Apply WSGI middleware here.
 # from helloworld.wsgi import HelloWorldApplication
 # application = HelloWorldApplication(application)
@@ -0,0 +1,23 @@
+"""
+Gunicorn settings, used by the Procfile.
+
+Activity long-polls and event streams keep a request open for a long time, which would tie up a whole sync worker
+each.  By default the workers are gevent's cooperative ones instead, so a few processes can hold thousands of idle
+connections.  Set GUNICORN_WORKER_CLASS=sync to go back to plain workers.
+"""
+import multiprocessing, os
+
+bind = '0.0.0.0:{port}'.format(port=os.environ.get('PORT', '8000'))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gevent')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', 1000)) # per gevent worker.
+
+# cooperative workers keep checking in with the arbiter while requests are held, but a sync worker is busy for the
+# whole request and has to outlast ACTIVITY_STREAM_SECONDS.
+timeout = 30 if worker_class != 'sync' else 6 * 60
+
+def post_fork(server, worker):
+    if worker_class == 'gevent':
+        # psycopg2 blocks the whole process while it waits on postgres unless it is told to yield to other greenlets.
+        from psycogreen.gevent import patch_psycopg
+        patch_psycopg()
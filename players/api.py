@@ -1,8 +1,11 @@
 from django.template.loader import render_to_string
 from tastypie.authorization import ReadOnlyAuthorization
 from tastypie.authentication import SessionAuthentication
-from tastypie.exceptions import Unauthorized
+from tastypie.exceptions import BadRequest, Unauthorized
+from tastypie.http import HttpNotModified
+from tastypie.paginator import Paginator
 from tastypie.resources import ModelResource
+from . import notify, retention
 from .models import ActivityLog
 
 class ActivityLogAuthorization(ReadOnlyAuthorization):
@@ -16,30 +19,144 @@ class ActivityLogAuthorization(ReadOnlyAuthorization):
         return bundle.obj.to_player == bundle.request.user
     
 
+class KeysetPaginator(Paginator):
+    """
+    Pages newest first through a list already bounded by since_id/before_id (see ActivityLogResource.build_filters), so
+    each page is an index range scan on id rather than an OFFSET, and there is no total_count to work out.  next is the
+    page of older rows, keeping since_id; previous is anything newer.  Clients that still send offset get the usual
+    offset pagination.
+    """
+    def page(self):
+        if 'offset' in self.request_data:
+            return super(KeysetPaginator, self).page()
+        limit = self.get_limit()
+        objects = list(self.objects[:limit + 1] if limit else self.objects)
+        meta = {'limit': limit, 'previous': None, 'next': None}
+        if limit and len(objects) > limit:
+            objects = objects[:limit]
+            meta['next'] = self._keyset_uri(before_id=objects[-1].pk)
+        if objects and 'before_id' in self.request_data:
+            meta['previous'] = self._keyset_uri(since_id=objects[0].pk)
+        return {self.collection_name: objects, 'meta': meta}
+
+    def _keyset_uri(self, **bounds):
+        if self.resource_uri is None:
+            return None
+        params = self.request_data.copy() # a QueryDict; setting a key replaces its values.
+        for key in ('offset', 'since_id', 'before_id'):
+            params.pop(key, None)
+        if 'before_id' in bounds and 'since_id' in self.request_data:
+            params['since_id'] = self.request_data['since_id']
+        for key, value in bounds.items():
+            params[key] = value
+        params['limit'] = self.get_limit()
+        return '{uri}?{query}'.format(uri=self.resource_uri, query=params.urlencode())
+
+
 class ActivityLogResource(ModelResource):
     class Meta:
-        queryset = ActivityLog.objects.all()
+        queryset = ActivityLog.objects.select_related('from_player', 'to_player')
         resource_name = 'players/activity_log'
         authentication = SessionAuthentication()
         authorization = ActivityLogAuthorization()
         allowed_methods = ['get',]
         ordering = ['-pk']
         fields = ['id','activity_type','from_player','viewed']
+        paginator_class = KeysetPaginator
+        
+    def dispatch_list(self, request, **kwargs):
+        # a poll that has already seen everything gets a 304 straight from the cache, once the session's player is
+        # known to still be there.
+        etag = None
+        if request.method == 'GET':
+            self.is_authenticated(request)
+            etag = notify.etag(request.user.pk, request.GET)
+        if etag is not None and request.META.get('HTTP_IF_NONE_MATCH') == etag:
+            return HttpNotModified()
+        response = super(ActivityLogResource, self).dispatch_list(request, **kwargs)
+        if etag is not None and response.status_code == 200:
+            response['ETag'] = etag
+        return response
+    
+    def build_filters(self, filters=None):
+        # since_id/before_id bound the ids returned: a poll asks for what it hasn't seen, paging back asks for older.
+        orm_filters = super(ActivityLogResource, self).build_filters(filters)
+        for name, lookup in (('since_id', 'pk__gt'), ('before_id', 'pk__lt')):
+            if filters and name in filters:
+                if not filters[name].isdigit():
+                    raise BadRequest('{name} must be an activity log id.'.format(name=name))
+                orm_filters[lookup] = int(filters[name])
+        return orm_filters
         
     def dehydrate(self, bundle):
-        # include full html for activity.
-        bundle.data['activity_html'] = render_to_string('player/activity_log_entry.html', {'activity':bundle.obj}).replace("\t","").replace("\n", "")
+        # include full html for activity, rendered once per entry.
+        bundle.data['activity_html'] = bundle.obj.html
         bundle.data['from_player'] = bundle.obj.from_player.handle
+        # shown entries are tracked by the player's seen cursor now, not by writing viewed.
+        seen_id = self.once_per_response(bundle.request, ('seen_id', bundle.obj.to_player_id), lambda: retention.seen_id(bundle.obj.to_player_id))
+        bundle.data['viewed'] = bundle.obj.viewed or bundle.obj.pk <= seen_id
         
         # include hp if activity is a fight.
         if bundle.obj.activity_type in ('pvp_attacker', 'pvp_defender'):
-            bundle.data['hit_points'] = bundle.obj.to_player.hit_points
-            bundle.data['hp_class'], bundle.data['percent_hp_remaining'] = bundle.obj.to_player.get_hp_status()
+            to_player = bundle.obj.to_player
+            bundle.data['hit_points'] = to_player.hit_points
+            bundle.data['hp_class'], bundle.data['percent_hp_remaining'] = self.once_per_response(bundle.request, ('hp_status', to_player.hit_points, to_player.hit_points_max), to_player.get_hp_status)
             
         
         # if activity is an arrival or departure, then include html needed to add to the nearby players list interface.
         elif bundle.obj.activity_type in ('arrival','departure'):
-            bundle.data['other_players_blurb'] = render_to_string('player/other_players_blurb.html', {'player':bundle.obj.to_player})
-            if bundle.obj.activity_type == 'arrival':
-                bundle.data['other_players_html'] = render_to_string('player/other_player.html', {'player':bundle.obj.from_player})
+            # to_player is always the user asking (see ActivityLogAuthorization), whose square is already loaded.
+            bundle.data.update(self.nearby_players_data(bundle.request, bundle.obj, bundle.request.user))
         return bundle
+    
+    def once_per_response(self, request, key, compute):
+        """Values that come out the same for every entry in a response, like the player's hp status or nearby players
+        blurb, are worked out for the first entry and kept on the request."""
+        if not hasattr(request, '_activity_log_values'):
+            request._activity_log_values = {}
+        if key not in request._activity_log_values:
+            request._activity_log_values[key] = compute()
+        return request._activity_log_values[key]
+    
+    def new_response(self, request):
+        """Forget the values kept by once_per_response, for long-lived requests that answer more than once."""
+        request._activity_log_values = {}
+    
+    def nearby_players_data(self, request, activity, player):
+        data = {'other_players_blurb': self.once_per_response(request, ('other_players_blurb', player.pk), lambda: render_to_string('player/other_players_blurb.html', {'player':player}))}
+        if activity.activity_type == 'arrival':
+            data['other_players_html'] = render_to_string('player/other_player.html', {'player':activity.from_player})
+        return data
+    
+    def square_event_data(self, request, event):
+        """A SquareEvent in the same shape as a dehydrated activity log entry, plus where it happened."""
+        player = request.user
+        data = {
+            'id': event.pk,
+            'activity_type': event.activity_type,
+            'from_player': event.from_player.handle,
+            'from_player_id': event.from_player_id,
+            'x': event.map_square.x,
+            'y': event.map_square.y,
+            'activity_html': event.html,
+        }
+        # only players on the same square show up in the nearby players list.
+        if event.map_square_id == player.map_square_id:
+            data.update(self.nearby_players_data(request, event, player))
+        return data
+    
+    def square_events(self, request, since_id=None, limit=None):
+        """The newest square events, or with since_id the oldest ones after it, so a client moving its cursor up to the
+        last id it got never skips any."""
+        if since_id is not None and not since_id.isdigit():
+            since_id = None
+        events = request.user.get_square_events(since_id=since_id)
+        if since_id is not None:
+            events = events.order_by('pk')
+        return [self.square_event_data(request, event) for event in events[:limit or self._meta.limit]]
+    
+    def alter_list_data_to_serialize(self, request, data):
+        # arrivals and departures are stored once per square instead of once per observer, so they are merged in here.
+        if request.user.is_authenticated():
+            data['events'] = self.square_events(request, since_id=request.GET.get('event_since'))
+        return data
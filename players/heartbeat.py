@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from world import presence
+
+import datetime
+
+def _key(player_id):
+    return 'players:heartbeat:{id}'.format(id=player_id)
+
+def beat(player):
+    """Record that the player is active.  The heartbeat goes to the cache; player.here_since is only moved forward, for
+    the caller to save, once the stored value is more than HEARTBEAT_FLUSH_SECONDS old.  Returns True when it was."""
+    seen = now()
+    cache.set(_key(player.pk), seen, presence.ACTIVE_SECONDS)
+    presence.touch(player.map_square, player.pk)
+    if player.here_since is None or seen - player.here_since > datetime.timedelta(seconds=settings.HEARTBEAT_FLUSH_SECONDS):
+        player.here_since = seen
+        return True
+    return False
+
+def last_seen(player):
+    """The freshest of the cached heartbeat and the stored here_since."""
+    seen = cache.get(_key(player.pk))
+    if seen is None or (player.here_since is not None and player.here_since > seen):
+        return player.here_since
+    return seen
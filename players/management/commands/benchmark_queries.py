@@ -0,0 +1,178 @@
+from django.core import management
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.timezone import now
+from optparse import make_option
+from players.models import ACTIVITY_LOG_MINUTES, ActivityLog, Player
+from players.retention import LEGACY_ACTIVITY_TYPES
+from south.db import db
+from south.management.commands import patch_for_test_db_setup
+from world.models import WorldMap
+from world.presence import ACTIVE_SECONDS
+from world.utils import batches
+
+import datetime, itertools, logging, random, time
+
+logger = logging.getLogger(__name__)
+
+# the composite indexes benchmarked, as index_together declares them: model, field names.
+COMPOSITE_INDEXES = [(model, fields) for model in (Player, ActivityLog) for fields in model._meta.index_together]
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ANALYZE ',
+    'mysql': 'EXPLAIN ',
+}
+
+# a table's indexes as (index name, column) rows in column order: django 1.5's introspection leaves out multi-column
+# indexes, so these read the database's own catalog.
+INDEX_COLUMNS = {
+    'sqlite': "SELECT m.name, i.name FROM sqlite_master m, pragma_index_info(m.name) i WHERE m.type = 'index' AND m.tbl_name = %s ORDER BY m.name, i.seqno",
+    'postgresql': 'SELECT i.relname, pg_get_indexdef(x.indexrelid, k + 1, true) FROM pg_index x JOIN pg_class i ON i.oid = x.indexrelid '
+        'JOIN pg_class t ON t.oid = x.indrelid, generate_series(0, x.indnatts - 1) k WHERE t.relname = %s ORDER BY i.relname, k',
+    'mysql': 'SELECT index_name, column_name FROM information_schema.statistics WHERE table_schema = DATABASE() AND table_name = %s ORDER BY index_name, seq_in_index',
+}
+
+class Command(BaseCommand):
+    args = ''
+    help = ('Build a throwaway test database (test_<name>, or in memory for sqlite), load a dataset of players and '
+        'activity into it, then EXPLAIN and time the hot player queries without and with the composite indexes.  The '
+        'configured database is never touched; the test database is destroyed afterwards.')
+    option_list = BaseCommand.option_list + (
+        make_option('--players', type='int', default=100000),
+        make_option('--activity', type='int', default=2, help='Activity log entries per player.'),
+        make_option('--world-map', type='int', default=1, help='The map from the mapdata fixture to scatter the players over.'),
+        make_option('--repeat', type='int', default=20, help='How many times to run each query for the timings.'),
+        make_option('--batch-size', type='int', default=1000),
+        make_option('--indexed-only', action='store_true', default=False, help='Only benchmark with the indexes.'),
+        make_option('--noinput', action='store_false', dest='interactive', default=True, help="Don't ask before replacing an old test database."),
+    )
+
+    def handle(self, *args, **options):
+        explain = EXPLAIN.get(connection.vendor)
+        if explain is None:
+            raise CommandError('Not sure how to EXPLAIN on {vendor}.'.format(vendor=connection.vendor))
+
+        # the test database is set up the way south sets it up for the tests: synced, or migrated if SOUTH_TESTS_MIGRATE.
+        patch_for_test_db_setup()
+        database_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=not options['interactive'])
+        try:
+            management.call_command('loaddata', 'mapdata', verbosity=0)
+            try:
+                world_map = WorldMap.objects.get(pk=options['world_map'])
+            except WorldMap.DoesNotExist:
+                raise CommandError('There is no world map {id} in the mapdata fixture.'.format(id=options['world_map']))
+
+            if not options['indexed_only']:
+                self.drop_indexes()
+                self.run('without composite indexes', world_map, explain, options)
+                self.create_indexes()
+            self.run('with composite indexes', world_map, explain, options)
+        finally:
+            connection.creation.destroy_test_db(database_name, verbosity=0)
+
+    def drop_indexes(self):
+        # syncdb and the migrations name the indexes differently, so drop them by whatever the database calls them.
+        db.start_transaction()
+        for model, fields in COMPOSITE_INDEXES:
+            table = model._meta.db_table
+            columns = [model._meta.get_field(field).column for field in fields]
+            names = [name for name, indexed in self.indexes(table) if indexed == columns]
+            if not names:
+                raise CommandError('There is no index on {table} ({columns}).'.format(table=table, columns=', '.join(columns)))
+            for name in names:
+                db.execute(db.drop_index_string % {'index_name': db.quote_name(name), 'table_name': db.quote_name(table)})
+        db.commit_transaction()
+
+    def indexes(self, table):
+        cursor = connection.cursor()
+        cursor.execute(INDEX_COLUMNS[connection.vendor], [table])
+        return [(name, [column for index, column in rows]) for name, rows in itertools.groupby(cursor.fetchall(), lambda row: row[0])]
+
+    def create_indexes(self):
+        db.start_transaction()
+        for model, fields in COMPOSITE_INDEXES:
+            db.create_index(model._meta.db_table, [model._meta.get_field(field).column for field in fields])
+        db.commit_transaction()
+
+    def run(self, title, world_map, explain, options):
+        # the dataset is committed and deleted again rather than rolled back, so the next run starts from an empty
+        # database: sqlite commits before running an EXPLAIN.
+        self.stdout.write('== {title} =='.format(title=title))
+        handle_prefix = 'bench{run}_'.format(run=int(time.time()))
+        try:
+            started = time.time()
+            with transaction.commit_on_success():
+                player_ids, square_ids = self.load(world_map, handle_prefix, options)
+            self.stdout.write('loaded {players} players in {seconds:.1f}s.'.format(players=len(player_ids), seconds=time.time() - started))
+            for name, queryset in self.queries(player_ids, square_ids):
+                self.report(name, queryset, explain, options['repeat'])
+        finally:
+            self.delete(handle_prefix)
+
+    def load(self, world_map, handle_prefix, options):
+        square_ids = list(world_map.mapsquare_set.values_list('pk', flat=True))
+        if not square_ids:
+            raise CommandError('World map {id} has no squares.'.format(id=world_map.pk))
+        password = Player.objects.make_random_password() # never used to log in; the players are deleted again.
+
+        def players():
+            for n in xrange(options['players']):
+                yield Player(email='{handle}{n}@example.com'.format(handle=handle_prefix, n=n), first_name='Bench', last_name='Mark',
+                    handle='{handle}{n}'.format(handle=handle_prefix, n=n), gender='M', password=password, world_map=world_map,
+                    map_square_id=random.choice(square_ids))
+        for batch in batches(players(), options['batch_size']):
+            Player.objects.bulk_create(batch)
+        player_ids = list(Player.objects.filter(handle__startswith=handle_prefix).order_by('pk').values_list('pk', flat=True))
+
+        # here_since is auto_now_add, so spread the players over the last day afterwards, ten minutes per slice of ids.
+        started = now()
+        slices = 24 * 6
+        for n, ids in enumerate(batches(player_ids, len(player_ids) // slices + 1)):
+            Player.objects.filter(pk__range=(ids[0], ids[-1])).update(here_since=started - datetime.timedelta(minutes=10 * n))
+
+        def activity():
+            for player_id in player_ids:
+                for n in xrange(options['activity']):
+                    yield ActivityLog(to_player_id=player_id, from_player_id=random.choice(player_ids), activity_type='event',
+                        message='Something happened.', viewed=random.random() < 0.5)
+        for batch in batches(activity(), options['batch_size']):
+            ActivityLog.objects.bulk_create(batch)
+        return player_ids, square_ids
+
+    def delete(self, handle_prefix):
+        with transaction.commit_on_success():
+            ActivityLog.objects.filter(to_player__handle__startswith=handle_prefix).delete()
+            # straight to sql: the ORM would load every player to look for related rows there aren't any of.
+            cursor = connection.cursor()
+            cursor.execute('DELETE FROM {table} WHERE handle LIKE %s'.format(table=connection.ops.quote_name(Player._meta.db_table)), [handle_prefix + '%'])
+
+    def queries(self, player_ids, square_ids):
+        player = Player.objects.get(pk=random.choice(player_ids))
+        recent = now() - datetime.timedelta(minutes=ACTIVITY_LOG_MINUTES)
+        first_id = ActivityLog.objects.order_by('pk').values_list('pk', flat=True)[0]
+        return (
+            ('presence: active players on a map cell', Player.objects.filter(map_square__in=random.sample(square_ids, min(len(square_ids), 64)), here_since__gte=now() - datetime.timedelta(seconds=ACTIVE_SECONDS)).values_list('pk', 'map_square', 'here_since')),
+            ('player_detail: player by handle', Player.objects.filter(handle=player.handle)),
+            ('activity log: latest messages', player.activitylog_to_player.filter(Q(created_at__gte=recent) | Q(viewed=False, pk__gt=0)).exclude(activity_type__in=LEGACY_ACTIVITY_TYPES)[:10]),
+            ('retention: one batch of rows', ActivityLog.objects.filter(pk__gte=first_id).order_by('pk').values('pk', 'created_at', 'to_player', 'viewed')[:1000]),
+        )
+
+    def report(self, name, queryset, explain, repeat):
+        sql, params = queryset.query.get_compiler(using=queryset.db).as_sql()
+        cursor = connection.cursor()
+        cursor.execute(explain + sql, params)
+        plan = [' '.join(unicode(column) for column in row) for row in cursor.fetchall()]
+
+        started = time.time()
+        for n in xrange(repeat):
+            cursor.execute(sql, params)
+            cursor.fetchall()
+        milliseconds = (time.time() - started) * 1000 / max(repeat, 1)
+
+        self.stdout.write('{name}: {milliseconds:.2f}ms'.format(name=name, milliseconds=milliseconds))
+        for line in plan:
+            self.stdout.write('    {line}'.format(line=line))
+        logger.info('benchmark {name}: {milliseconds:.2f}ms'.format(name=name, milliseconds=milliseconds))
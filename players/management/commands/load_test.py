@@ -0,0 +1,90 @@
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, SESSION_KEY
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+from django.utils.importlib import import_module
+from optparse import make_option
+from players.models import Player
+
+import logging, threading, time, urllib, urllib2
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    args = '<base url>'
+    help = ('Hold --connections activity long-polls open against a running server, then time --probes ordinary requests '
+        'while they are held.  With sync workers the probes queue behind the held requests; with cooperative workers they '
+        'should come straight back.')
+    option_list = BaseCommand.option_list + (
+        make_option('--player', help='Handle of the player to long-poll as.'),
+        make_option('--connections', type='int', default=500),
+        make_option('--ramp-seconds', type='float', default=5.0, help='Spread opening the connections over this long.'),
+        make_option('--probes', type='int', default=20),
+        make_option('--probe-path', default=None, help='What to request while the long-polls are held.  Defaults to the login page.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1 or not options['player']:
+            raise CommandError('Usage: load_test {args} --player <handle>'.format(args=self.args))
+        base_url = args[0].rstrip('/')
+        try:
+            player = Player.objects.get(handle=options['player'])
+        except Player.DoesNotExist:
+            raise CommandError('There is no player {handle}.'.format(handle=options['player']))
+
+        # a session for the player, so the long-polls are logged in.
+        session = import_module(settings.SESSION_ENGINE).SessionStore()
+        session[SESSION_KEY] = player.pk
+        session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+        session.save()
+        cookie = '{name}={key}'.format(name=settings.SESSION_COOKIE_NAME, key=session.session_key)
+
+        # cursors past everything there is, so every long-poll is held until it times out.
+        latest = player.activitylog_to_player.order_by('-pk').values_list('pk', flat=True)[:1]
+        poll_url = '{base}{path}?{query}'.format(base=base_url, path=reverse('players_activity_poll'), query=urllib.urlencode({'since_id': latest[0] if latest else 0, 'event_since': 2 ** 31 - 1}))
+        probe_url = base_url + (options['probe_path'] or reverse('login'))
+
+        stats = {'open': 0, 'most_open': 0, 'finished': 0, 'errors': 0}
+        lock = threading.Lock()
+
+        def hold():
+            with lock:
+                stats['open'] += 1
+                stats['most_open'] = max(stats['most_open'], stats['open'])
+            try:
+                urllib2.urlopen(urllib2.Request(poll_url, headers={'Cookie': cookie}), timeout=settings.LONG_POLL_TIMEOUT + 30).read()
+                outcome = 'finished'
+            except Exception as e:
+                logger.debug('long-poll failed: {error}'.format(error=e))
+                outcome = 'errors'
+            with lock:
+                stats['open'] -= 1
+                stats[outcome] += 1
+
+        threading.stack_size(256 * 1024) # the default 8MB per thread adds up quickly.
+        self.stdout.write('Opening {connections} long-polls to {url}'.format(connections=options['connections'], url=poll_url))
+        for n in xrange(options['connections']):
+            worker = threading.Thread(target=hold)
+            worker.daemon = True
+            worker.start()
+            time.sleep(options['ramp_seconds'] / max(options['connections'], 1))
+        time.sleep(1)
+
+        timings, failures = [], 0
+        for n in xrange(options['probes']):
+            started = time.time()
+            try:
+                urllib2.urlopen(probe_url, timeout=settings.LONG_POLL_TIMEOUT).read()
+                timings.append(time.time() - started)
+            except Exception as e:
+                logger.debug('probe failed: {error}'.format(error=e))
+                failures += 1
+
+        with lock:
+            self.stdout.write('Long-polls held open at once: {most_open} (still open: {open}, answered early: {finished}, failed: {errors})'.format(**stats))
+        if timings:
+            timings.sort()
+            self.stdout.write('Probes to {url}: {count} ok, {failures} failed; fastest {fastest:.0f}ms, median {median:.0f}ms, slowest {slowest:.0f}ms'.format(
+                url=probe_url, count=len(timings), failures=failures, fastest=timings[0] * 1000, median=timings[len(timings) // 2] * 1000, slowest=timings[-1] * 1000))
+        else:
+            self.stdout.write('Probes to {url}: all {failures} failed.'.format(url=probe_url, failures=failures))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from optparse import make_option
+from players import retention
+
+class Command(BaseCommand):
+    args = ''
+    help = 'Delete activity log entries that have been seen and are more than a few minutes old, and old square events.  Run every few minutes.'
+    option_list = BaseCommand.option_list + (
+        make_option('--batch-size', type='int', default=1000, help='Rows looked at per transaction.'),
+    )
+
+    def handle(self, *args, **options):
+        activity, events = retention.purge(options['batch_size'])
+        self.stdout.write('Deleted {activity} activity log entries and {events} square events.'.format(activity=activity, events=events))
@@ -1,6 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.db.models import F
+from players import notify
 from players.models import Player
+from world.utils import batches
 
 import logging
 
@@ -24,4 +26,7 @@ class Command(BaseCommand):
             weird_event = False,
             done_special = False,
             flirted = False
-        )
\ No newline at end of file
+        )
+        # hit points changed behind the cached activity log versions.
+        for player_ids in batches(Player.objects.values_list('pk', flat=True).iterator(), 1000):
+            notify.forget_players(player_ids)
\ No newline at end of file
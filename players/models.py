@@ -1,12 +1,25 @@
+from django.conf import settings
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
+from django.core.cache import cache
 from django.db import models
+from django.db.models import Q
 from django.utils.timezone import now
 
-from game.models import DatesMixin
-from world.models import MapSquare, WorldMap
+from game.models import ActivityEntryMixin, DatesMixin
+from world import presence
+from world.grid import DIRECTION_NAMES, OPPOSITE_DIRECTIONS, get_grid
+from world.models import MapSquare, SquareEvent, WorldMap
+from world.pathfinding import find_path, step_cost
+
+from . import heartbeat, notify, retention
 
 import datetime, random
 
+ACTIVITY_LOG_MINUTES = 10 # how long seen activity stays in the log.
+
+def _square_event_floor_key(player_id):
+    return 'players:square_event_floor:{id}'.format(id=player_id)
+
 class InvalidAttackException(Exception):
     pass
     
@@ -139,6 +152,9 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['first_name', 'last_name', 'handle', 'gender']
     
+    class Meta:
+        index_together = (('map_square', 'here_since'),) # who has been on a square recently.
+    
     def get_pronoun(self):
         if self.gender == 'M': return 'He' 
         else: return 'She'
@@ -158,11 +174,34 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
         return ('success', percent_hp_remaining)
     
     def get_activity_log(self):
-        if self.activitylog_to_player.all():
-            self.activitylog_to_player.filter(created_at__lt=(now()-datetime.timedelta(minutes=10)), viewed=True).delete() # purge messages that are older than 10 minutes and have already been seen.
-            self.activitylog_to_player.filter(activity_type__in=['arrival','departure'], viewed=True).delete()
-            self.activitylog_to_player.all().update(viewed=True)
-        return self.activitylog_to_player.all()[:10]
+        # one select, through the (to_player, id) index: what came in the last 10 minutes, plus anything older the
+        # player hasn't been shown yet.  nothing is written; retention deletes what has been seen, in the background.
+        recent = now() - datetime.timedelta(minutes=ACTIVITY_LOG_MINUTES)
+        unseen = Q(viewed=False, pk__gt=retention.seen_id(self.pk))
+        activity = list(self.activitylog_to_player.filter(Q(created_at__gte=recent) | unseen).exclude(activity_type__in=retention.LEGACY_ACTIVITY_TYPES)[:10])
+        if activity:
+            retention.mark_seen(self.pk, activity[0].pk)
+        activity += list(self.get_square_events()[:10])
+        return sorted(activity, key=lambda a: a.created_at, reverse=True)[:10]
+    
+    def get_square_events(self, since_id=None):
+        """Arrivals and departures made by other players within VIEW_RADIUS squares since the player got here (and after
+        since_id)."""
+        floor = self._square_event_floor()
+        if since_id is not None:
+            floor = max(floor, int(since_id))
+        recent = now() - datetime.timedelta(minutes=ACTIVITY_LOG_MINUTES)
+        square_ids = get_grid(self.map_square.world_map_id).square_ids_within(self.map_square.x, self.map_square.y, settings.VIEW_RADIUS)
+        return SquareEvent.objects.filter(map_square__in=square_ids, pk__gt=floor, created_at__gte=recent).exclude(from_player=self).select_related('from_player', 'map_square')
+    
+    def _square_event_floor(self):
+        # the id of the player's own arrival on this square; anything before it happened before they got here.
+        floor = cache.get(_square_event_floor_key(self.pk))
+        if floor is None or floor[0] != self.map_square_id:
+            arrivals = self.square_events.filter(map_square=self.map_square_id, activity_type='arrival').order_by('-pk').values_list('pk', flat=True)[:1]
+            floor = (self.map_square_id, arrivals[0] if arrivals else 0)
+            cache.set(_square_event_floor_key(self.pk), floor)
+        return floor[1]
         
     def get_fight_status(self):
         percent_fights_remaining = int((self.fights_left * 1.0 / self.MAX_FIGHTS) * 100)
@@ -173,7 +212,9 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
         return ('info', percent_fights_remaining)
     
     def add_activity_log(self, from_player, activity_type, message):
-        return ActivityLog.objects.create(to_player=self, from_player=from_player, activity_type=activity_type, message=message)
+        activity = ActivityLog.objects.create(to_player=self, from_player=from_player, activity_type=activity_type, message=message)
+        notify.activity_posted(activity)
+        return activity
     
     def attack_player(self, defender):
         if self.map_square.safe:
@@ -201,7 +242,7 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
             raise InvalidAttackException("{defender} looks at you. {pronoun} scoffs and walks away.".format(defender=defender.handle, pronoun=defender.get_pronoun()))
         
         # reset the online counter.
-        self.here_since = now()
+        self.mark_active()
         
         attacker_fight_description = ""
         defender_fight_description = ""
@@ -304,57 +345,113 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
             defender.dead = True
             defender.last_dead_time = now()
         defender.save()
+        notify.player_changed(defender)
         return damage
         
         
     def move(self, direction):
+        self.move_sequence(direction)
+        return
+    
+    def move_sequence(self, directions):
+        """Walk a string of directions ("NNEEE") in one go.  Every step is checked against the map and costs the turns of
+        the terrain it enters; the walk stops at the first illegal step or when MAX_TRAVEL_TURNS runs out.  The player
+        ends up on the last square reached with one departure and one arrival announcement.  Returns (steps, turns,
+        stopped) where stopped is the InvalidMoveException that cut the walk short, if any."""
         if self.dead:
             raise PlayerDeadException("You are dead.  You're not going anywhere.")
         
-        next_y = current_y = self.map_square.y
-        next_x = current_x = self.map_square.x
-        from_direction_name = direction_name = ''
+        grid = get_grid(self.world_map_id)
+        x, y = start = (self.map_square.x, self.map_square.y)
+        taken, turns, stopped = [], 0, None
+        for direction in directions:
+            try:
+                if direction not in DIRECTION_NAMES:
+                    raise InvalidMoveException("You cannot move that way.")
+                next_x, next_y = grid.step(x, y, direction)
+                if grid.square_id(next_x, next_y) is None:
+                    raise InvalidMoveException("You cannot move {direction} from here.".format(direction=DIRECTION_NAMES[direction]))
+                if not grid.is_passable(next_x, next_y):
+                    raise InvalidMoveException("Terrain to the {direction} is not passable.".format(direction=DIRECTION_NAMES[direction]))
+                cost = step_cost(grid, grid.index(next_x, next_y))
+                if turns + cost > settings.MAX_TRAVEL_TURNS:
+                    raise InvalidMoveException("You are too tired to go any further.")
+            except InvalidMoveException as e:
+                if not taken: # nothing happened, so this is just an invalid move.
+                    raise
+                stopped = e
+                break
+            x, y, turns = next_x, next_y, turns + cost
+            taken.append(direction)
         
-        if direction == 'N':
-            next_y -= 1
-            direction_name = 'North'
-            from_direction_name = 'South'
-        elif direction == 'S':
-            next_y += 1
-            direction_name = 'South'
-            from_direction_name = 'North'
-        elif direction == 'W':
-            next_x -= 1
-            direction_name = 'West'
-            from_direction_name = 'East'
-        elif direction == 'E':
-            next_x += 1
-            direction_name = 'East'
-            from_direction_name = 'West'
+        if (x, y) != start:
+            self.relocate(grid.square(x, y), taken[0], taken[-1])
+        return len(taken), turns, stopped
+    
+    def travel(self, x, y):
+        """Walk the cheapest path to x/y in one go.  Returns the turns the journey took."""
+        if self.dead:
+            raise PlayerDeadException("You are dead.  You're not going anywhere.")
         
-        try:
-            next_map_square = MapSquare.objects.get(world_map=self.world_map, x=next_x, y=next_y)
-        except:
-            raise InvalidMoveException("You cannot move {direction} from here.".format(direction=direction_name))
-            
-        if not next_map_square.terrain.passable:
-            raise InvalidMoveException("Terrain to the {direction} is not passable.".format(direction=direction_name))
+        grid = get_grid(self.world_map_id)
+        if not grid.is_passable(x, y):
+            raise InvalidMoveException("You cannot travel there.")
         
-        # announce move
-        self.map_square.announce_departure(player=self, to_direction=direction_name)
-        next_map_square.announce_arrival(player=self, from_direction=from_direction_name)
+        path = find_path(grid, (self.map_square.x, self.map_square.y), (x, y), max_cost=settings.MAX_TRAVEL_TURNS)
+        if path is None:
+            raise InvalidMoveException("You cannot find a way there from here.")
         
+        steps, turns, stopped = self.move_sequence(path[0])
+        return turns
+    
+    def relocate(self, next_map_square, departure_direction, arrival_direction):
+        """Put the player on next_map_square, announcing the departure and arrival.  The caller saves."""
+        self.map_square.announce_departure(player=self, to_direction=DIRECTION_NAMES[departure_direction])
+        arrival = next_map_square.announce_arrival(player=self, from_direction=DIRECTION_NAMES[OPPOSITE_DIRECTIONS[arrival_direction]])
+        cache.set(_square_event_floor_key(self.pk), (next_map_square.pk, arrival.pk))
+        
+        presence.leave(self.map_square, self.pk)
         self.map_square = next_map_square
-        self.here_since = now()
-
+        self.mark_active()
+        notify.player_changed(self)
+        return
+    
+    def refresh_map_square(self):
+        """Reload the player's square, for long-lived requests that can outlast a move made in another request."""
+        self.map_square = MapSquare.objects.get(player=self.pk)
+        self.world_map_id = self.map_square.world_map_id
         return
     
+    def nearby_player_ids(self):
+        return presence.active_player_ids(self.map_square, exclude=self.pk)
+    
+    def players_in_view(self):
+        """{player_id: (x, y)} for the other active players within VIEW_RADIUS squares."""
+        map_square = self.map_square
+        return presence.players_within(map_square.world_map_id, map_square.x, map_square.y, settings.VIEW_RADIUS, exclude=self.pk)
+    
+    def nearby_player_count(self):
+        return len(self.nearby_player_ids())
+    
     def nearby_players(self):
-        return self.map_square.player_set.filter(here_since__gt=now()-datetime.timedelta(minutes=10)).exclude(pk=self.pk)
+        nearby_player_ids = self.nearby_player_ids()
+        if not nearby_player_ids:
+            return Player.objects.none()
+        return Player.objects.filter(pk__in=nearby_player_ids)
+    
+    def mark_active(self):
+        """Reset the online counter and show the player on their square.  Returns True when here_since changed and
+        needs saving; in between, the heartbeat only lives in the cache."""
+        return heartbeat.beat(self)
+    
+    @property
+    def last_seen(self):
+        return heartbeat.last_seen(self)
     
     def reset(self):
         self.dead, self.hit_points, self.fights_left, self.human_fights_left, self.seen_bard, self.seen_dragon, self.seen_master, self.seen_violet, self.weird_event, self.done_special, self.flirted = False, self.hit_points_max, self.MAX_FIGHTS, self.MAX_HUMAN_FIGHTS, Player(), False, False, False, False, False, False, False
         self.save()
+        notify.player_changed(self)
         return
         
     @property
@@ -363,9 +460,10 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
             return "Dead"
         if self.inn:
             return "Sleeping at Inn"
-        if self.here_since < (now() - datetime.timedelta(minutes=10)):
+        last_seen = self.last_seen
+        if last_seen < (now() - datetime.timedelta(minutes=10)):
             return "Offline"
-        if self.here_since < (now() - datetime.timedelta(minutes=5)):
+        if last_seen < (now() - datetime.timedelta(minutes=5)):
             return "Idle"
         return "Active"
         
@@ -373,7 +471,7 @@ class Player(AbstractBaseUser, PermissionsMixin, DatesMixin):
     def __unicode__(self):
         return self.handle
 
-class ActivityLog(DatesMixin):
+class ActivityLog(ActivityEntryMixin, DatesMixin):
     """Use this model to push messages to any user as needed."""
     ACTIVITY_TYPES = (
         ('pvp_attacker', 'You attack'),
@@ -390,6 +488,14 @@ class ActivityLog(DatesMixin):
     
     class Meta:
         ordering = ('-id',)
+        index_together = (
+            ('to_player', 'viewed', 'created_at'), # reading and purging a player's log.
+            ('to_player', 'id'), # paging through it by id.
+        )
+        
+    @property
+    def dom_id(self):
+        return 'activity_log_{id}'.format(id=self.pk)
         
 
 class Armor(DatesMixin):
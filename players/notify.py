@@ -0,0 +1,68 @@
+from django.conf import settings
+from django.core.cache import cache
+
+from game import pubsub
+from world import presence
+
+import hashlib
+
+LATEST_SECONDS = 24 * 60 * 60 # a missing key just means a poll waits out its timeout and asks the database again.
+
+def _activity_key(player_id):
+    return 'players:latest_activity:{id}'.format(id=player_id)
+
+def _state_key(player_id):
+    return 'players:state:{id}'.format(id=player_id)
+
+def activity_posted(activity):
+    """Wake up anyone waiting on the player the activity was sent to."""
+    pubsub.publish(_activity_key(activity.to_player_id), activity.pk, LATEST_SECONDS)
+
+def latest_ids(player):
+    """What the cache says is newest for the player right now: their activity and the square events in view, keyed by
+    cache key.  Take it before reading the database and pass it to wait_for_activity, so nothing is missed."""
+    map_square = player.map_square
+    return pubsub.snapshot([_activity_key(player.pk)] + presence.event_keys(map_square.world_map_id, map_square.x, map_square.y, settings.VIEW_RADIUS))
+
+def wait_for_activity(player, seen, timeout):
+    """Wait until anything in seen (from latest_ids) moves on, or until timeout seconds have passed.  Nothing is read
+    while waiting; see game.pubsub."""
+    return pubsub.wait(seen, timeout)
+
+def player_changed(player):
+    """Note the player's hit points and position, which the activity log shows and is looked at from.  Called whenever
+    either changes."""
+    map_square = player.map_square
+    cache.set(_state_key(player.pk), (player.hit_points, map_square.world_map_id, map_square.x, map_square.y), LATEST_SECONDS)
+
+def forget_players(player_ids):
+    """For changes made to many players at once with update()."""
+    cache.delete_many([_state_key(player_id) for player_id in player_ids])
+
+def etag(player_id, params):
+    """
+    A version of everything the activity log shows the player, for conditional GETs: the newest activity id, hit points
+    and position, the newest square event in view, and the query (bar jQuery's cache buster).  Normally two cache reads;
+    anything missing is read from the database and put back with add(), so it can't overwrite a newer value.  None when
+    there is no such player.
+    """
+    from .models import ActivityLog, Player
+    cached = cache.get_many([_activity_key(player_id), _state_key(player_id)])
+    latest = cached.get(_activity_key(player_id))
+    if latest is None:
+        latest = ActivityLog.objects.filter(to_player=player_id).order_by('-pk').values_list('pk', flat=True)[:1]
+        latest = latest[0] if latest else 0
+        cache.add(_activity_key(player_id), latest, LATEST_SECONDS)
+    state = cached.get(_state_key(player_id))
+    if state is None:
+        try:
+            player = Player.objects.select_related('map_square').get(pk=player_id)
+        except Player.DoesNotExist:
+            return None
+        map_square = player.map_square
+        state = (player.hit_points, map_square.world_map_id, map_square.x, map_square.y)
+        cache.add(_state_key(player_id), state, LATEST_SECONDS)
+    hit_points, world_map_id, x, y = state
+    query = sorted((key, value) for key, value in params.lists() if key != '_')
+    version = (latest, state, presence.latest_event_id(world_map_id, x, y, settings.VIEW_RADIUS), query)
+    return '"{hash}"'.format(hash=hashlib.md5(repr(version)).hexdigest())
@@ -0,0 +1,111 @@
+"""
+How long activity stays around.  Reading the activity log doesn't write anything: the newest entry a player has been
+shown goes into the cache as their seen cursor, and this job deletes entries that are both seen and older than
+ACTIVITY_LOG_MINUTES, plus square events nobody can see any more.  Deletes go batch_size rows at a time, one short
+transaction each, so it never holds locks for long.
+
+The activity log is walked in id order from a low-water mark kept in the cache: everything below it has been looked at
+already, and what is left there is old but not yet seen.  Each run reads just those leftovers again, deleting them once
+their player's cursor has passed them, and carries on from the mark; a player who never comes back costs a run their
+unseen entries, not every id from their oldest one on.  If the mark drops out of the cache the next run walks the whole
+table once.
+
+Every web process runs it every ACTIVITY_RETENTION_SECONDS from a background thread, with a cache lock so only one of
+them does the work each time.  Set that to 0 to schedule the purge_activity_log command instead.
+"""
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils.timezone import now
+
+import datetime, itertools, logging, threading, time
+
+logger = logging.getLogger(__name__)
+
+SEEN_SECONDS = 30 * 24 * 60 * 60 # a lost cursor only means unseen-looking entries wait until the player looks again.
+LEGACY_ACTIVITY_TYPES = ('arrival', 'departure') # written per observer before square events; gone once seen.
+LOCK_KEY = 'players:retention:lock'
+MARK_KEY = 'players:retention:activity_mark'
+MARK_SECONDS = 30 * 24 * 60 * 60
+
+def _seen_key(player_id):
+    return 'players:activity_seen:{id}'.format(id=player_id)
+
+def seen_id(player_id):
+    """The newest activity id the player has been shown, or 0."""
+    return cache.get(_seen_key(player_id)) or 0
+
+def mark_seen(player_id, activity_id):
+    if activity_id > seen_id(player_id):
+        cache.set(_seen_key(player_id), activity_id, SEEN_SECONDS)
+
+def _expired(cutoff):
+    from .models import ACTIVITY_LOG_MINUTES
+    return cutoff or now() - datetime.timedelta(minutes=ACTIVITY_LOG_MINUTES)
+
+def _walk(model, start, cutoff, batch_size, fields, is_expired, end=None):
+    """Walk model's rows from id start (up to end) in batches of batch_size rows, deleting those is_expired(rows) picks,
+    one transaction per batch.  ids grow with created_at, so the walk ends at the first row newer than the cutoff.
+    Returns how many were deleted and the id the next walk can start from."""
+    deleted = 0
+    queryset = model.objects.filter(pk__lt=end) if end is not None else model.objects.all()
+    while True:
+        with transaction.commit_on_success():
+            rows = list(queryset.filter(pk__gte=start).order_by('pk').values('pk', 'created_at', *fields)[:batch_size])
+            old = list(itertools.takewhile(lambda row: row['created_at'] < cutoff, rows))
+            expired = [row['pk'] for row in is_expired(old)]
+            if expired:
+                model.objects.filter(pk__in=expired).delete()
+        deleted += len(expired)
+        if old:
+            start = old[-1]['pk'] + 1
+        if len(old) < batch_size:
+            return deleted, start
+
+def purge_activity_log(batch_size=1000, cutoff=None):
+    """Delete activity log entries that have been seen (by the viewed flag or the player's seen cursor) and are older
+    than the cutoff.  Returns how many were deleted."""
+    from .models import ActivityLog
+    cutoff = _expired(cutoff)
+    
+    def is_expired(rows):
+        seen = cache.get_many([_seen_key(player_id) for player_id in set(row['to_player'] for row in rows)])
+        for row in rows:
+            if row['viewed'] or row['pk'] <= seen.get(_seen_key(row['to_player']), 0):
+                yield row
+    fields = ('to_player', 'viewed')
+    mark = cache.get(MARK_KEY) or 0
+    left_over = _walk(ActivityLog, 0, cutoff, batch_size, fields, is_expired, end=mark)[0] if mark else 0 # seen since?
+    walked, mark = _walk(ActivityLog, mark, cutoff, batch_size, fields, is_expired)
+    cache.set(MARK_KEY, mark, MARK_SECONDS)
+    return left_over + walked
+
+def purge_square_events(batch_size=1000, cutoff=None):
+    """Delete square events older than the cutoff; get_square_events never shows them.  Returns how many were deleted."""
+    from world.models import SquareEvent
+    # every old event goes, so the oldest row left is always where to start.
+    return _walk(SquareEvent, 0, _expired(cutoff), batch_size, (), lambda rows: rows)[0]
+
+def purge(batch_size=1000):
+    activity, events = purge_activity_log(batch_size), purge_square_events(batch_size)
+    logger.info('retention: deleted {activity} activity log entries and {events} square events.'.format(activity=activity, events=events))
+    return activity, events
+
+def _run_every(seconds, batch_size):
+    while True:
+        time.sleep(seconds)
+        if not cache.add(LOCK_KEY, True, seconds): # another process has it this time around.
+            continue
+        try:
+            purge(batch_size)
+        except Exception:
+            logger.exception('retention: purge failed.')
+        finally:
+            for alias in connections:
+                connections[alias].close()
+
+def start_scheduler(seconds, batch_size=1000):
+    """Purge every seconds seconds from a daemon thread (a greenlet under gevent workers)."""
+    thread = threading.Thread(target=_run_every, args=(seconds, batch_size), name='activity-retention')
+    thread.daemon = True
+    thread.start()
+    return thread
@@ -1,40 +1,125 @@
 activity_log_container = $('#activity_log_container');
 other_player_container = $('ul#other-players');
+latest_activity_id = 0;
+latest_event_id = 0; // arrivals and departures on this square come from a separate stream of square events.
+activity_log_container.children().each(function() {
+	if (this.id.indexOf('square_event_') == 0) {
+		latest_event_id = Math.max(latest_event_id, parseInt(this.id.replace('square_event_', ''), 10) || 0);
+	} else {
+		latest_activity_id = Math.max(latest_activity_id, parseInt(this.id.replace('activity_log_', ''), 10) || 0);
+	}
+});
 
-(function poll_activity_log() {
-	setTimeout(function() {
-		$.ajax({
-			url: "/api/players/activity_log/",
-			type: "GET",
-			success: function(data) {
-				update_activity_log(data);
-			},
-			dataType: "json",
-			complete: poll_activity_log,
-			timeout: 2000
-		})
-	}, 2000);
-})();
+// new activity is pushed over server-sent events where the browser supports them.  the browser reconnects a dropped
+// stream by itself; if it gives up for good, fall back to long-polling.
+if (window.EventSource) {
+	var activity_stream = new EventSource('/players/activity.stream?since_id=' + latest_activity_id + '&event_since=' + latest_event_id);
+	activity_stream.addEventListener('activity', function(e) {
+		update_activity_log({objects: [$.parseJSON(e.data)]});
+	});
+	activity_stream.addEventListener('event', function(e) {
+		update_activity_log({events: [$.parseJSON(e.data)]});
+	});
+	activity_stream.onerror = function() {
+		if (activity_stream.readyState == EventSource.CLOSED) {
+			poll_activity_log();
+		}
+	};
+} else {
+	poll_activity_log();
+}
+
+// long-poll: the server holds each request until there is something new (or about 25 seconds pass), so ask again as
+// soon as it answers.  back off for a few seconds after an error.
+function poll_activity_log() {
+	$.ajax({
+		url: "/players/activity.json",
+		type: "GET",
+		data: {since_id: latest_activity_id, event_since: latest_event_id},
+		cache: false,
+		ifModified: true, // sends If-None-Match; a 304 means nothing new, with no data.
+		dataType: "json",
+		timeout: 35000,
+		success: function(data) {
+			if (data) {
+				update_activity_log({objects: data.activity, events: data.events});
+			}
+			poll_activity_log();
+		},
+		error: function() {
+			setTimeout(poll_activity_log, 5000);
+		}
+	});
+}
 
 function update_activity_log(data) {
-	data.objects.map(function(item) {
-		item_id = '#activity_log_' + item.id;
-		
-		// only run if the activity isn't displayed.
-		if ($(item_id).length == 0) {
-			var new_activity = $(item.activity_html).hide();
-			activity_log_container.prepend(new_activity);
-			new_activity.slideDown();
-			if (item.activity_type == 'arrival') {
-				$('#other-players-blurb').html(item.other_players_blurb);
-				other_player_container.append(item.other_players_html);
-			} else if (item.activity_type == 'departure') {
-				$('#other-players-blurb').html(item.other_players_blurb);
-				$('#oplayer_' + item.from_player).remove();
-			} else if (item.activity_type == 'pvp_defender' || item.activity_type == 'pvp_attacker') {
-				$('#my_hitpoints').css('width', item.percent_hp_remaining + '%');
-				$('#my_hitpoints').parent().removeClass().addClass('progress progress-striped progress-' + item.hp_class);
+	$.each(data.objects || [], function(i, item) {
+		latest_activity_id = Math.max(latest_activity_id, item.id);
+		show_activity('#activity_log_' + item.id, item);
+	});
+	$.each(data.events || [], function(i, item) {
+		latest_event_id = Math.max(latest_event_id, item.id);
+		show_activity('#square_event_' + item.id, item);
+		if (typeof world_map != 'undefined') {
+			world_map.move_other_player(item);
+		}
+	});
+}
+
+function show_activity(item_id, item) {
+	// only run if the activity isn't displayed.
+	if ($(item_id).length == 0) {
+		var new_activity = $(item.activity_html).hide();
+		update_timesince(new_activity);
+		activity_log_container.prepend(new_activity);
+		new_activity.slideDown();
+		if (item.activity_type == 'arrival') {
+			$('#other-players-blurb').html(item.other_players_blurb);
+			var other_player = $(item.other_players_html);
+			if ($('#' + other_player.attr('id')).length == 0) {
+				other_player_container.append(other_player);
+			}
+		} else if (item.activity_type == 'departure') {
+			$('#other-players-blurb').html(item.other_players_blurb);
+			$('#oplayer_' + item.from_player).remove();
+		} else if (item.activity_type == 'pvp_defender' || item.activity_type == 'pvp_attacker') {
+			$('#my_hitpoints').css('width', item.percent_hp_remaining + '%');
+			$('#my_hitpoints').parent().removeClass().addClass('progress progress-striped progress-' + item.hp_class);
+		}
+	}
+}
+
+// the same wording as django's timesince filter: the biggest unit and, if any, the next one down.
+var TIMESINCE_CHUNKS = [[60 * 60 * 24 * 365, 'year'], [60 * 60 * 24 * 30, 'month'], [60 * 60 * 24 * 7, 'week'], [60 * 60 * 24, 'day'], [60 * 60, 'hour'], [60, 'minute']];
+
+function timesince(seconds) {
+	function count_of(count, name) {
+		return count + ' ' + name + (count == 1 ? '' : 's');
+	}
+	seconds = Math.max(0, Math.floor(seconds)); // the browser's clock may be a little behind the server's.
+	for (var i = 0; i < TIMESINCE_CHUNKS.length; i++) {
+		var count = Math.floor(seconds / TIMESINCE_CHUNKS[i][0]);
+		if (count > 0) {
+			var result = count_of(count, TIMESINCE_CHUNKS[i][1]);
+			if (i + 1 < TIMESINCE_CHUNKS.length) {
+				var next_count = Math.floor((seconds - count * TIMESINCE_CHUNKS[i][0]) / TIMESINCE_CHUNKS[i + 1][0]);
+				if (next_count > 0) {
+					result += ', ' + count_of(next_count, TIMESINCE_CHUNKS[i + 1][1]);
+				}
 			}
+			return result;
 		}
+	}
+	return count_of(0, 'minute');
+}
+
+function update_timesince(container) {
+	var now = new Date().getTime() / 1000;
+	$(container).find('.timesince').addBack('.timesince').each(function() {
+		$(this).text(timesince(now - $(this).data('timestamp')));
 	});
-}
\ No newline at end of file
+}
+
+// entry markup is rendered once on the server and cached, so "how long ago" is worked out here and kept current.
+update_timesince(activity_log_container);
+setInterval(function() { update_timesince(activity_log_container); }, 30000);
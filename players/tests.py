@@ -5,7 +5,21 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from world import presence
+from world.grid import get_grid, invalidate_grid
+from world.models import MapSquare, SquareEvent, Terrain
+from world.pathfinding import find_path
+
+from . import notify, retention
+from .models import ActivityLog, InvalidMoveException, Player
+
+import calendar, datetime, json
 
 
 class SimpleTest(TestCase):
@@ -14,3 +28,461 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class PlayerMoveTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_grid()
+        self.player = Player.objects.create_user('mover@example.com', 'Move', 'Er', 'mover', 'M', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+
+    def test_move(self):
+        self.player.move('N')
+        self.assertEqual((self.player.map_square.x, self.player.map_square.y), (4, 3))
+        self.player.save(update_fields=['world_map', 'map_square', 'here_since'])
+        self.assertEqual(Player.objects.get(pk=self.player.pk).map_square_id, MapSquare.objects.get(world_map=1, x=4, y=3).pk)
+
+    def test_move_off_map(self):
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=0, y=0)
+        self.assertRaises(InvalidMoveException, self.player.move, 'W')
+
+    def test_move_impassable(self):
+        MapSquare.objects.filter(world_map=1, x=5, y=4).update(terrain=Terrain.objects.filter(passable=False)[0])
+        invalidate_grid(1)
+        self.assertRaises(InvalidMoveException, self.player.move, 'E')
+
+    def test_move_sequence(self):
+        MapSquare.objects.filter(world_map=1, x=5, y=3).update(terrain=Terrain.objects.get(name='Rocky'))
+        invalidate_grid(1)
+        steps, turns, stopped = self.player.move_sequence('NEE')
+        self.assertEqual((steps, stopped), (3, None))
+        grid = get_grid(1)
+        self.assertEqual(turns, sum(max(grid.terrain_at(x, 3).turns, 1) for x in (4, 5, 6)))
+        self.assertEqual((self.player.map_square.x, self.player.map_square.y), (6, 3))
+
+    def test_move_sequence_stops_at_illegal_step(self):
+        MapSquare.objects.filter(world_map=1, x=4, y=2).update(terrain=Terrain.objects.filter(passable=False)[0])
+        invalidate_grid(1)
+        watcher = Player.objects.create_user('watcher@example.com', 'Watch', 'Er', 'watcher', 'M', 'password')
+        watcher.map_square = MapSquare.objects.get(world_map=1, x=4, y=3)
+        watcher.mark_active()
+        watcher.save()
+
+        steps, turns, stopped = self.player.move_sequence('NNW')
+        self.assertEqual(steps, 1)
+        self.assertIsInstance(stopped, InvalidMoveException)
+        self.assertEqual((self.player.map_square.x, self.player.map_square.y), (4, 3))
+        self.assertEqual([event.activity_type for event in watcher.get_square_events()], ['arrival', 'departure']) # not one pair per step.
+        self.assertRaises(InvalidMoveException, self.player.move_sequence, 'NW')
+
+    def test_travel(self):
+        turns = self.player.travel(6, 5)
+        self.assertEqual((self.player.map_square.x, self.player.map_square.y), (6, 5))
+        self.assertEqual(turns, find_path(get_grid(1), (4, 4), (6, 5))[1])
+
+    def test_travel_impassable(self):
+        MapSquare.objects.filter(world_map=1, x=6, y=5).update(terrain=Terrain.objects.filter(passable=False)[0])
+        invalidate_grid(1)
+        self.assertRaises(InvalidMoveException, self.player.travel, 6, 5)
+
+
+class PresenceTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_grid()
+        self.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.players = []
+        for handle in ('watcher', 'walker'):
+            player = Player.objects.create_user('{handle}@example.com'.format(handle=handle), 'First', 'Last', handle, 'M', 'password')
+            player.map_square = self.map_square
+            player.mark_active()
+            player.save()
+            self.players.append(player)
+
+    def test_nearby_players(self):
+        watcher, walker = self.players
+        with self.assertNumQueries(0):
+            self.assertEqual(watcher.nearby_player_count(), 1)
+            self.assertEqual(self.map_square.active_player_ids(exclude=walker.pk), [watcher.pk])
+        self.assertEqual(list(watcher.nearby_players()), [walker])
+
+    @override_settings(VIEW_RADIUS=2)
+    def test_players_in_view(self):
+        watcher, walker = self.players
+        walker.travel(4, 2)
+        walker.save()
+        self.assertEqual(watcher.players_in_view(), {walker.pk: (4, 2)})
+        self.assertEqual(watcher.nearby_player_count(), 0)
+
+        far = MapSquare.objects.get(world_map=1, x=8, y=8) # across a spatial hash cell boundary.
+        presence.touch(far, walker.pk)
+        self.assertEqual(presence.players_within(1, 7, 7, 1), {walker.pk: (8, 8)})
+        self.assertEqual(presence.players_within(1, 5, 5, 2), {watcher.pk: (4, 4)})
+
+        walker.move_sequence('NN')
+        self.assertEqual([event.map_square.y for event in watcher.get_square_events()], [2, 2, 4]) # the arrival out of view is not seen.
+
+    def test_presence_rebuilt_from_database(self):
+        watcher, walker = self.players
+        cache.clear()
+        self.assertEqual(sorted(watcher.nearby_player_ids() + [watcher.pk]), sorted([watcher.pk, walker.pk]))
+        Player.objects.filter(pk=walker.pk).update(here_since=now() - datetime.timedelta(seconds=presence.ACTIVE_SECONDS + 60))
+        cache.clear()
+        self.assertEqual(watcher.nearby_player_ids(), [])
+
+    def test_concurrent_updates_to_a_cell(self):
+        import threading
+        read_bucket, carry_on = threading.Event(), threading.Event()
+        square_bucket = presence._square_bucket
+        def slow_square_bucket(map_square):
+            # the first update stops between reading the bucket and writing it back.
+            bucket = square_bucket(map_square)
+            if threading.current_thread().name == 'first':
+                read_bucket.set()
+                carry_on.wait(5)
+            return bucket
+        presence._square_bucket = slow_square_bucket
+        try:
+            first = threading.Thread(target=presence.touch, args=(self.map_square, 1001), name='first')
+            second = threading.Thread(target=presence.touch, args=(self.map_square, 1002), name='second')
+            first.start()
+            read_bucket.wait(5)
+            second.start()
+            second.join(0.2) # waits for the first update's lock.
+            carry_on.set()
+            first.join()
+            second.join()
+        finally:
+            presence._square_bucket = square_bucket
+        self.assertTrue(set([1001, 1002]) <= set(self.map_square.active_player_ids()))
+
+    def test_move_updates_presence_and_announces(self):
+        watcher, walker = self.players
+        walker.move('N')
+        walker.save()
+        self.assertEqual(watcher.nearby_player_count(), 0)
+        self.assertEqual(walker.map_square.active_player_ids(), [walker.pk])
+        self.assertEqual([(event.activity_type, event.map_square.y) for event in watcher.get_square_events()], [('arrival', 3), ('departure', 4)])
+        self.assertFalse(walker.get_square_events().exists()) # nothing has happened here since the walker arrived.
+
+    def test_square_events_written_once(self):
+        watcher, walker = self.players
+        for handle in ('one', 'two', 'three'):
+            player = Player.objects.create_user('{handle}@example.com'.format(handle=handle), 'First', 'Last', handle, 'M', 'password')
+            player.map_square = self.map_square
+            player.mark_active()
+            player.save()
+        get_grid(1)
+        with self.assertNumQueries(2): # one departure, one arrival, however many players are watching.
+            walker.move('N')
+
+        latecomer = Player.objects.create_user('late@example.com', 'Late', 'Comer', 'latecomer', 'M', 'password')
+        latecomer.map_square = MapSquare.objects.get(world_map=1, x=4, y=5)
+        latecomer.move('N')
+        self.assertEqual([event.from_player for event in latecomer.get_square_events()], [])
+        self.assertEqual([event.from_player for event in watcher.get_square_events()], [latecomer, latecomer, walker, walker])
+        self.assertEqual(len(watcher.get_activity_log()), 4)
+
+    def test_activity_log_api_merges_square_events(self):
+        watcher, walker = self.players
+        walker.move('N')
+        walker.save()
+        self.client.login(email='watcher@example.com', password='password')
+        data = json.loads(self.client.get('/api/players/activity_log/').content)
+        arrival, departure = data['events']
+        self.assertEqual((arrival['activity_type'], arrival['x'], arrival['y']), ('arrival', 4, 3))
+        self.assertNotIn('other_players_blurb', arrival) # not on the watcher's square.
+        self.assertEqual((departure['activity_type'], departure['from_player']), ('departure', 'walker'))
+        self.assertIn('other_players_blurb', departure)
+        self.assertIn('square_event_', departure['activity_html'])
+        data = json.loads(self.client.get('/api/players/activity_log/', {'event_since': data['events'][0]['id']}).content)
+        self.assertEqual(data['events'], [])
+
+
+class HeartbeatTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        self.player = Player.objects.create_user('beat@example.com', 'Heart', 'Beat', 'beat', 'F', 'password')
+
+    def test_heartbeat_coalesces_writes(self):
+        self.player.here_since = now() - datetime.timedelta(minutes=7)
+        self.assertEqual(self.player.status, 'Idle')
+        self.assertTrue(self.player.mark_active())
+        self.assertFalse(self.player.mark_active())
+        self.assertEqual(self.player.status, 'Active')
+
+    def test_status_reads_heartbeat(self):
+        Player.objects.filter(pk=self.player.pk).update(here_since=now() - datetime.timedelta(seconds=30))
+        player = Player.objects.get(pk=self.player.pk)
+        self.assertFalse(player.mark_active())
+        stale = Player.objects.get(pk=self.player.pk)
+        stale.here_since = now() - datetime.timedelta(minutes=20)
+        self.assertEqual(stale.status, 'Active')
+
+
+class MovePlayerJsonTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_grid()
+        self.player = Player.objects.create_user('ajax@example.com', 'Aj', 'Ax', 'ajax', 'M', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+        self.client.login(email='ajax@example.com', password='password')
+
+    def test_move(self):
+        activity = self.player.add_activity_log(self.player, 'event', 'Something happened.')
+        response = self.client.post(reverse('players_move_player_json'), {'directions': 'N', 'since_id': activity.pk - 1})
+        data = json.loads(response.content)
+        self.assertEqual((data['x'], data['y']), (4, 3))
+        self.assertEqual([entry['id'] for entry in data['activity']], [activity.pk])
+        self.assertIn('From here it is', data['possible_moves_html'])
+        self.assertEqual(Player.objects.get(pk=self.player.pk).map_square.y, 3)
+
+    def test_travel(self):
+        response = self.client.post(reverse('players_move_player_json'), {'x': 6, 'y': 5})
+        self.assertEqual((json.loads(response.content)['x'], json.loads(response.content)['y']), (6, 5))
+
+    def test_invalid_move(self):
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=0, y=0)
+        self.player.save()
+        response = self.client.post(reverse('players_move_player_json'), {'directions': 'W'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('error', json.loads(response.content))
+
+
+class ActivityPollTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_grid()
+        self.player = Player.objects.create_user('poll@example.com', 'Po', 'Ll', 'poll', 'F', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+        self.client.login(email='poll@example.com', password='password')
+
+    @override_settings(LONG_POLL_TIMEOUT=0)
+    def test_poll(self):
+        activity = self.player.add_activity_log(self.player, 'event', 'Something happened.')
+        data = json.loads(self.client.get(reverse('players_activity_poll'), {'since_id': activity.pk - 1}).content)
+        self.assertEqual([entry['id'] for entry in data['activity']], [activity.pk])
+        data = json.loads(self.client.get(reverse('players_activity_poll'), {'since_id': activity.pk}).content)
+        self.assertEqual((data['activity'], data['events']), ([], []))
+
+    @override_settings(LONG_POLL_TIMEOUT=0)
+    def test_poll_not_modified(self):
+        url = reverse('players_activity_poll')
+        response = self.client.get(url, {'since_id': 0, '_': 1})
+        with self.assertNumQueries(2): # session and user, for login_required.
+            self.assertEqual(self.client.get(url, {'since_id': 0, '_': 2}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+        self.player.add_activity_log(self.player, 'event', 'Something happened.')
+        self.assertEqual(self.client.get(url, {'since_id': 0}, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 200)
+
+    def test_api_not_modified(self):
+        url = '/api/players/activity_log/'
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(1): # the user, to authenticate.
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(url, {'limit': 5}, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.player.hit_points -= 1
+        self.player.save()
+        notify.player_changed(self.player)
+        self.assertNotEqual(self.client.get(url)['ETag'], etag)
+        etag = self.client.get(url)['ETag']
+        self.player.move('N')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_api_player_gone(self):
+        url = '/api/players/activity_log/'
+        etag = self.client.get(url)['ETag']
+        Player.objects.filter(pk=self.player.pk).delete()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 401) # not a 304 from the warm cache.
+        cache.clear()
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.assertEqual(notify.etag(self.player.pk, {}), None)
+
+    @override_settings(LONG_POLL_INTERVAL=0.01)
+    def test_wait_for_activity(self):
+        seen = notify.latest_ids(self.player)
+        self.assertFalse(notify.wait_for_activity(self.player, seen, 0.05))
+        self.player.add_activity_log(self.player, 'event', 'Something happened.')
+        self.assertTrue(notify.wait_for_activity(self.player, seen, 5))
+
+        seen = notify.latest_ids(self.player)
+        walker = Player.objects.create_user('walker@example.com', 'Walk', 'Er', 'walker', 'M', 'password')
+        walker.map_square = MapSquare.objects.get(world_map=1, x=6, y=6)
+        walker.move('N')
+        self.assertTrue(notify.wait_for_activity(self.player, seen, 5))
+
+
+class ActivityStreamTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        invalidate_grid()
+        self.player = Player.objects.create_user('stream@example.com', 'Str', 'Eam', 'stream', 'F', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+        self.client.login(email='stream@example.com', password='password')
+
+    def read_stream(self, **extra):
+        response = self.client.get(reverse('players_activity_stream'), **extra)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return ''.join(response.streaming_content)
+
+    @override_settings(ACTIVITY_STREAM_SECONDS=0.05, LONG_POLL_INTERVAL=0.01)
+    def test_stream_resumes_from_last_event_id(self):
+        first = self.player.add_activity_log(self.player, 'event', 'First.')
+        second = self.player.add_activity_log(self.player, 'event', 'Second.')
+        walker = Player.objects.create_user('walker@example.com', 'Walk', 'Er', 'walker', 'M', 'password')
+        walker.map_square = MapSquare.objects.get(world_map=1, x=4, y=5)
+        walker.move('N')
+
+        stream = self.read_stream()
+        self.assertLess(stream.index('First.'), stream.index('Second.'))
+        self.assertEqual(stream.count('event: event\n'), 2) # the walker's departure and arrival, both in view.
+
+        stream = self.read_stream(HTTP_LAST_EVENT_ID='{id}-0'.format(id=first.pk))
+        self.assertNotIn('First.', stream)
+        self.assertIn('id: {id}-'.format(id=second.pk), stream)
+
+    @override_settings(ACTIVITY_STREAM_SECONDS=0.2, LONG_POLL_INTERVAL=0.01, LONG_POLL_TIMEOUT=0, API_LIMIT_PER_PAGE=10)
+    def test_backlog_delivered_in_full(self):
+        ids = [self.player.add_activity_log(self.player, 'event', 'Message {n}.'.format(n=n)).pk for n in range(15)]
+        stream = self.read_stream(HTTP_LAST_EVENT_ID='{id}-0'.format(id=ids[0] - 1))
+        self.assertEqual([int(line.split(':')[1].split('-')[0]) for line in stream.splitlines() if line.startswith('id: ')], ids)
+
+        delivered, since_id = [], ids[0] - 1
+        while True:
+            data = json.loads(self.client.get(reverse('players_activity_poll'), {'since_id': since_id}).content)
+            delivered += [entry['id'] for entry in data['activity']]
+            if not data['more']:
+                break
+            since_id = delivered[-1]
+        self.assertEqual(delivered, ids)
+
+    def test_poller_wakes_waiters_for_other_processes(self):
+        import threading
+        from game import pubsub
+        seen = notify.latest_ids(self.player)
+        key = 'players:latest_activity:{id}'.format(id=self.player.pk)
+        def other_process_publishes():
+            cache.set(key, 10 ** 6) # straight to the cache, as another process's publish() looks from here.
+            pubsub._poll_once()
+        threading.Timer(0.05, other_process_publishes).start()
+        self.assertTrue(notify.wait_for_activity(self.player, seen, 5))
+
+    def test_publish_wakes_waiters_in_process(self):
+        import threading, time
+        seen = notify.latest_ids(self.player)
+        activity = ActivityLog(pk=10 ** 6, to_player_id=self.player.pk)
+        threading.Timer(0.05, notify.activity_posted, [activity]).start()
+        with self.settings(LONG_POLL_INTERVAL=30):
+            started = time.time()
+            self.assertTrue(notify.wait_for_activity(self.player, seen, 10))
+            self.assertLess(time.time() - started, 5)
+
+
+class ActivityLogTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        cache.clear()
+        self.player = Player.objects.create_user('reader@example.com', 'Read', 'Er', 'reader', 'F', 'password')
+
+    def test_get_activity_log_hides_seen_old_messages(self):
+        old = self.player.add_activity_log(self.player, 'event', 'Long ago.')
+        self.player.add_activity_log(self.player, 'event', 'Just now.')
+        self.player.activitylog_to_player.filter(pk=old.pk).update(created_at=now() - datetime.timedelta(minutes=20))
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.assertEqual([activity.message for activity in self.player.get_activity_log()], ['Just now.', 'Long ago.']) # not seen yet.
+        with self.assertNumQueries(2): # the activity log and square events; nothing is written.
+            self.assertEqual([activity.message for activity in self.player.get_activity_log()], ['Just now.'])
+        self.assertEqual(self.player.activitylog_to_player.count(), 2)
+
+        self.assertEqual(retention.purge_activity_log(batch_size=1), 1)
+        self.assertEqual([activity.message for activity in self.player.activitylog_to_player.all()], ['Just now.'])
+
+    def test_retention_keeps_unseen_messages(self):
+        unseen = self.player.add_activity_log(self.player, 'event', 'While you were out.')
+        recent = self.player.add_activity_log(self.player, 'event', 'Just now.')
+        self.player.activitylog_to_player.filter(pk=unseen.pk).update(created_at=now() - datetime.timedelta(minutes=20))
+        retention.mark_seen(self.player.pk, recent.pk - 2)
+        walker = Player.objects.create_user('walker@example.com', 'Walk', 'Er', 'walker', 'M', 'password')
+        walker.map_square = MapSquare.objects.get(world_map=1, x=4, y=5)
+        walker.move('N')
+        SquareEvent.objects.update(created_at=now() - datetime.timedelta(minutes=20))
+
+        self.assertEqual(retention.purge(batch_size=2), (0, 2))
+        self.assertEqual(self.player.activitylog_to_player.count(), 2)
+        retention.mark_seen(self.player.pk, recent.pk)
+        self.assertEqual(retention.purge(), (1, 0))
+
+    def test_retention_resumes_past_unseen_messages(self):
+        unseen = self.player.add_activity_log(self.player, 'event', 'While you were out.')
+        seen = [self.player.add_activity_log(self.player, 'event', 'Message {n}.'.format(n=n)).pk for n in range(5)]
+        ActivityLog.objects.update(created_at=now() - datetime.timedelta(minutes=20))
+        ActivityLog.objects.filter(pk__in=seen).update(viewed=True)
+        self.player.add_activity_log(self.player, 'event', 'Just now.')
+        self.assertEqual(retention.purge_activity_log(batch_size=1), 5)
+        with self.assertNumQueries(2): # what is left below the mark, then the rows after it; not the ids in between.
+            self.assertEqual(retention.purge_activity_log(batch_size=2), 0)
+        retention.mark_seen(self.player.pk, unseen.pk)
+        self.assertEqual(retention.purge_activity_log(batch_size=1), 1)
+
+    def test_api_viewed_follows_seen_cursor(self):
+        first = self.player.add_activity_log(self.player, 'event', 'Seen.')
+        self.player.add_activity_log(self.player, 'event', 'Not yet.')
+        retention.mark_seen(self.player.pk, first.pk)
+        self.client.login(email='reader@example.com', password='password')
+        data = json.loads(self.client.get('/api/players/activity_log/').content)
+        self.assertEqual([activity['viewed'] for activity in data['objects']], [False, True])
+
+    def test_api_keyset_pagination(self):
+        ids = [self.player.add_activity_log(self.player, 'event', 'Message {n}.'.format(n=n)).pk for n in range(15)]
+        self.client.login(email='reader@example.com', password='password')
+        data = json.loads(self.client.get('/api/players/activity_log/', {'since_id': ids[2]}).content)
+        self.assertEqual([activity['id'] for activity in data['objects']], ids[:4:-1])
+        self.assertNotIn('total_count', data['meta'])
+
+        data = json.loads(self.client.get(data['meta']['next']).content)
+        self.assertEqual([activity['id'] for activity in data['objects']], ids[4:2:-1]) # since_id still applies.
+        self.assertIsNone(data['meta']['next'])
+        data = json.loads(self.client.get(data['meta']['previous']).content)
+        self.assertEqual(data['objects'][-1]['id'], ids[5])
+
+        response = self.client.get('/api/players/activity_log/', {'before_id': 'newest'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_html_rendered_once(self):
+        activity = self.player.add_activity_log(self.player, 'event', 'Something happened.')
+        html = activity.html
+        self.assertIn('id="{dom_id}"'.format(dom_id=activity.dom_id), html)
+        self.assertIn('data-timestamp="{timestamp}"'.format(timestamp=calendar.timegm(activity.created_at.utctimetuple())), html)
+        activity.message = 'Something else.'
+        self.assertEqual(ActivityLog.objects.get(pk=activity.pk).html, html) # from the cache.
+
+    def test_api_query_count_independent_of_page_size(self):
+        attacker = Player.objects.create_user('attacker@example.com', 'Att', 'Acker', 'attacker', 'M', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+        for n in range(10):
+            self.player.add_activity_log(attacker, ('event', 'pvp_defender', 'arrival')[n % 3], 'Message {n}.'.format(n=n))
+        self.client.login(email='reader@example.com', password='password')
+        self.client.get('/api/players/activity_log/', {'limit': 3}) # warm the session, the grid and presence.
+        for limit in (2, 10):
+            with self.assertNumQueries(4): # the user, the page, the user's square, square events.
+                data = json.loads(self.client.get('/api/players/activity_log/', {'limit': limit}).content)
+            self.assertEqual(len(data['objects']), limit)
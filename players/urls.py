@@ -1,10 +1,14 @@
 from django.conf.urls import patterns, include, url
 
 urlpatterns = patterns('',
+    url(r'^activity.json$', 'players.views.activity_poll', name='players_activity_poll'),
+    url(r'^activity.stream$', 'players.views.activity_stream', name='players_activity_stream'),
     url(r'^attack_player.go$', 'players.views.attack_player', name='players_attack_player'),
     url(r'^login.html$',  'django.contrib.auth.views.login', name="login"),
     url(r'^logout.html$', 'django.contrib.auth.views.logout', name="logout"),
     url(r'^move.go$', 'players.views.move_player', name='players_move_player'),
+    url(r'^move.json$', 'players.views.move_player_json', name='players_move_player_json'),
+    url(r'^travel.go$', 'players.views.travel', name='players_travel'),
     url(r'^(?P<player_handle>\w+)/detail.html$', 'players.views.player_detail', name='player_detail'),
     url(r'register.html', 'players.views.register', name='register'),
 )
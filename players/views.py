@@ -3,12 +3,17 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login
 from django.contrib import messages
 from django.core.urlresolvers import reverse
-from django.shortcuts import redirect, render
+from django.http import HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.template.loader import render_to_string
+from django.views.decorators.http import require_POST
 
+from . import notify
 from .admin import PlayerAddForm
+from .api import ActivityLogResource
 from .models import InvalidAttackException, InvalidMoveException, Player, PlayerDeadException
 
-import logging
+import json, logging, time
 
 logger = logging.getLogger(__name__)
 
@@ -40,6 +45,135 @@ def move_player(request):
     
     return redirect(reverse('world_map_main', args=(request.user.world_map.pk,)))
     
+@login_required
+def travel(request):
+    try:
+        request.user.travel(int(request.POST['x']), int(request.POST['y']))
+        request.user.save(update_fields=['world_map','map_square','here_since',])
+    except (KeyError, ValueError):
+        messages.error(request, 'Where did you want to go?')
+    except InvalidMoveException as e:
+        messages.error(request, e)
+    except PlayerDeadException as e:
+        messages.error(request, e)
+    
+    return redirect(reverse('world_map_main', args=(request.user.world_map.pk,)))
+    
+@login_required
+@require_POST
+def move_player_json(request):
+    """Walk a sequence of directions ("NNE"), or travel to x/y, and return everything the map page needs to update in
+    place."""
+    stopped = None
+    try:
+        if 'directions' in request.POST:
+            steps, turns, stopped = request.user.move_sequence(request.POST['directions'])
+        else:
+            request.user.travel(int(request.POST['x']), int(request.POST['y']))
+        request.user.save(update_fields=['world_map','map_square','here_since',])
+    except (KeyError, ValueError):
+        return _json_response({'error': 'Where did you want to go?'}, status=400)
+    except (InvalidMoveException, PlayerDeadException) as e:
+        return _json_response({'error': unicode(e)}, status=400)
+    
+    data = _position_data(request, since_id=request.POST.get('since_id'), event_since=request.POST.get('event_since'))
+    if stopped is not None:
+        data['error'] = unicode(stopped)
+    return _json_response(data)
+    
+@login_required
+def activity_poll(request):
+    """Long-poll for activity newer than since_id and square events newer than event_since.  The request is held until
+    there is some, or LONG_POLL_TIMEOUT seconds pass; either way the client asks again straight away."""
+    since_id, event_since = request.GET.get('since_id', '0'), request.GET.get('event_since')
+    deadline = time.time() + settings.LONG_POLL_TIMEOUT
+    while True:
+        # read before the database, so nothing posted in between is missed.
+        seen, etag = notify.latest_ids(request.user), notify.etag(request.user.pk, request.GET)
+        if etag == request.META.get('HTTP_IF_NONE_MATCH'):
+            data = None # the client already has everything up to this version.
+        else:
+            data = _activity_data(request, since_id=since_id, event_since=event_since)
+            if data['activity'] or data['events']:
+                break
+        if not notify.wait_for_activity(request.user, seen, deadline - time.time()):
+            break
+        request.user.refresh_map_square()
+    if data is None:
+        return HttpResponseNotModified()
+    response = _json_response(data)
+    response['ETag'] = etag
+    return response
+    
+@login_required
+def activity_stream(request):
+    """Server-sent events: new activity and square events are pushed as they happen.  Each message id is
+    "<activity id>-<event id>", so a reconnecting browser's Last-Event-ID picks up where the stream stopped."""
+    since_id, event_since = request.GET.get('since_id', '0'), request.GET.get('event_since', '0')
+    last_event_id = request.META.get('HTTP_LAST_EVENT_ID', '').split('-')
+    if len(last_event_id) == 2 and all(part.isdigit() for part in last_event_id):
+        since_id, event_since = last_event_id
+    if not (since_id.isdigit() and event_since.isdigit()):
+        since_id, event_since = '0', '0'
+    
+    response = StreamingHttpResponse(_activity_stream(request, int(since_id), int(event_since)), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no' # don't let nginx sit on the stream.
+    return response
+
+def _activity_stream(request, since_id, event_since):
+    yield 'retry: 2000\n\n'
+    deadline = time.time() + settings.ACTIVITY_STREAM_SECONDS
+    while time.time() < deadline:
+        seen = notify.latest_ids(request.user)
+        data = _activity_data(request, since_id=str(since_id), event_since=str(event_since))
+        for entry in data['activity']: # oldest first; a long backlog comes in batches until it is drained.
+            since_id = max(since_id, entry['id'])
+            yield _server_sent_event('activity', entry, since_id, event_since)
+        for entry in data['events']:
+            event_since = max(event_since, entry['id'])
+            yield _server_sent_event('event', entry, since_id, event_since)
+        if not (data['activity'] or data['events']):
+            if notify.wait_for_activity(request.user, seen, min(settings.STREAM_KEEPALIVE_SECONDS, max(deadline - time.time(), 0))):
+                request.user.refresh_map_square()
+            else:
+                yield ': keepalive\n\n'
+
+def _server_sent_event(event, data, since_id, event_since):
+    return 'id: {since_id}-{event_since}\nevent: {event}\ndata: {data}\n\n'.format(since_id=since_id, event_since=event_since, event=event, data=json.dumps(data))
+    
+def _position_data(request, since_id=None, event_since=None):
+    player = request.user
+    data = {
+        'world_map': player.world_map_id,
+        'x': player.map_square.x,
+        'y': player.map_square.y,
+        'possible_moves_html': render_to_string('world_map/possible_moves.html', {'possible_moves': player.map_square.get_possible_moves()}),
+        'other_players_blurb': render_to_string('player/other_players_blurb.html', {'player': player}),
+        'other_players_html': ''.join(render_to_string('player/other_player.html', {'player': nearby_player}) for nearby_player in player.nearby_players()),
+        'players_in_view': player.players_in_view(),
+    }
+    data.update(_activity_data(request, since_id=since_id, event_since=event_since))
+    return data
+
+def _activity_data(request, since_id=None, event_since=None):
+    # the activity and square events after the client's cursors, in the same shape as the activity log api.  both are
+    # oldest first, API_LIMIT_PER_PAGE at a time: more says there is another batch waiting behind this one.
+    limit = settings.API_LIMIT_PER_PAGE
+    resource = ActivityLogResource()
+    resource.new_response(request)
+    data = {'activity': [], 'events': resource.square_events(request, since_id=event_since, limit=limit + 1)}
+    if since_id and since_id.isdigit():
+        # through the resource's queryset, so both players come with the rows and to_player's hp is fresh.
+        for activity in resource.get_object_list(request).filter(to_player=request.user, pk__gt=since_id).order_by('pk')[:limit + 1]:
+            data['activity'].append(resource.full_dehydrate(resource.build_bundle(obj=activity, request=request)).data)
+    data['more'] = len(data['activity']) > limit or len(data['events']) > limit
+    data['activity'], data['events'] = data['activity'][:limit], data['events'][:limit]
+    return data
+
+def _json_response(data, status=200):
+    return HttpResponse(json.dumps(data), status=status, content_type='application/json')
+    
 @login_required
 def attack_player(request):
     return_url = reverse('world_map_main', args=(request.user.world_map.pk,))
@@ -71,5 +205,5 @@ def attack_player(request):
 
 @login_required
 def player_detail(request, player_handle):
-    player = Player.objects.get(handle=player_handle)
+    player = get_object_or_404(Player, handle=player_handle) # handle is unique, so this is an index lookup.
     return render(request, 'player/detail.html', {'player':player})
\ No newline at end of file
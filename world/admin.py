@@ -1,6 +1,9 @@
-from django.contrib import admin
+from django import forms
+from django.contrib import admin, messages
 from django.contrib.admin.views.decorators import staff_member_required
-from django.shortcuts import render_to_response
+from django.core.urlresolvers import reverse
+from django.shortcuts import get_object_or_404, redirect, render
+from django.views.decorators.http import require_POST
 
 from .models import *
 
@@ -40,14 +43,61 @@ class WorldMapAdmin(admin.ModelAdmin):
     class Meta:
         model = WorldMap
 
+class MapPaintForm(forms.Form):
+    SAFE_CHOICES = (('', 'unchanged'), ('1', 'yes'), ('0', 'no'))
+
+    squares = forms.RegexField(regex=r'^\s*\d+,\d+(\s*;\s*\d+,\d+)*\s*;?\s*$', required=False, help_text='x,y;x,y;...')
+    x_min = forms.IntegerField(required=False, min_value=0)
+    y_min = forms.IntegerField(required=False, min_value=0)
+    x_max = forms.IntegerField(required=False, min_value=0)
+    y_max = forms.IntegerField(required=False, min_value=0)
+    terrain = forms.ModelChoiceField(queryset=Terrain.objects.all(), required=False, empty_label='unchanged')
+    battle_odds = forms.IntegerField(required=False, min_value=0)
+    safe = forms.ChoiceField(choices=SAFE_CHOICES, required=False)
+
+    def __init__(self, world_map, *args, **kwargs):
+        super(MapPaintForm, self).__init__(*args, **kwargs)
+        self.world_map = world_map
+
+    def clean(self):
+        data = self.cleaned_data
+        rectangle = [data.get(field) for field in ('x_min', 'y_min', 'x_max', 'y_max')]
+        if data.get('squares'):
+            data['positions'] = [tuple(int(n) for n in square.split(',')) for square in data['squares'].split(';') if square.strip()]
+        elif None not in rectangle:
+            # clamped to the map first, so a huge corner doesn't expand into millions of positions.
+            x_min, y_min, x_max, y_max = rectangle
+            x_max, y_max = min(x_max, self.world_map.x_size - 1), min(y_max, self.world_map.y_size - 1)
+            data['positions'] = [(x, y) for y in xrange(y_min, y_max + 1) for x in xrange(x_min, x_max + 1)]
+        else:
+            raise forms.ValidationError('Select some squares or a rectangle to paint.')
+        return data
+
 @staff_member_required
 def world_map_editor(request, world_map_id=None):
     if world_map_id is None:
         raise ValueError('no map selected.')
 
-    terrain = Terrain.objects.all()
     world_map = WorldMap.objects.get(pk=world_map_id)
-    return render_to_response('admin/world_map.html', locals())
+    paint_form = MapPaintForm(world_map)
+    return render(request, 'admin/world_map.html', locals())
+
+@staff_member_required
+@require_POST
+def world_map_paint(request, world_map_id):
+    world_map = get_object_or_404(WorldMap, pk=world_map_id)
+    form = MapPaintForm(world_map, request.POST)
+    if form.is_valid():
+        safe = {'1': True, '0': False}.get(form.cleaned_data['safe'])
+        updated, created = world_map.paint(form.cleaned_data['positions'], terrain=form.cleaned_data['terrain'], battle_odds=form.cleaned_data['battle_odds'], safe=safe)
+        messages.success(request, 'Painted {updated} squares and created {created}.'.format(updated=updated, created=created))
+    else:
+        for error in form.non_field_errors():
+            messages.error(request, error)
+        for field, errors in form.errors.items():
+            if field != '__all__':
+                messages.error(request, '{field}: {errors}'.format(field=field, errors=' '.join(errors)))
+    return redirect(reverse('world_map_edit', kwargs={'world_map_id': world_map.pk}))
     
     
 admin.site.register(WorldMap, WorldMapAdmin)
\ No newline at end of file
@@ -0,0 +1,81 @@
+from django.db import transaction
+
+from .models import MapSquare, Terrain, WorldMap
+from .utils import batches
+
+import random
+
+def value_noise(width, height, scale, seed=None, octaves=3):
+    """Rows of smooth noise normalized to 0..1.  Each octave interpolates a random lattice that is twice as fine as the
+    one before it, at half the weight."""
+    rng = random.Random(seed)
+    values = [[0.0] * width for y in xrange(height)]
+    amplitude = 1.0
+    for octave in xrange(octaves):
+        spacing = max(scale / float(2 ** octave), 1.0)
+        lattice = [[rng.random() for x in xrange(int(width / spacing) + 2)] for y in xrange(int(height / spacing) + 2)]
+        for y in xrange(height):
+            ly = y / spacing
+            y0 = int(ly)
+            ty = ly - y0
+            ty = ty * ty * (3 - 2 * ty)
+            top_row, bottom_row, row = lattice[y0], lattice[y0 + 1], values[y]
+            for x in xrange(width):
+                lx = x / spacing
+                x0 = int(lx)
+                tx = lx - x0
+                tx = tx * tx * (3 - 2 * tx)
+                top = top_row[x0] + (top_row[x0 + 1] - top_row[x0]) * tx
+                bottom = bottom_row[x0] + (bottom_row[x0 + 1] - bottom_row[x0]) * tx
+                row[x] += amplitude * (top + (bottom - top) * ty)
+        amplitude /= 2
+
+    low = min(min(row) for row in values)
+    high = max(max(row) for row in values)
+    span = (high - low) or 1.0
+    return [[(value - low) / span for value in row] for row in values]
+
+def default_terrain_order():
+    # lowest to highest ground: anything impassable (water) first, then passable terrain from the easiest to the hardest to cross.
+    terrain = list(Terrain.objects.all())
+    return sorted(terrain, key=lambda t: (t.passable, t.turns, t.pk))
+
+def assign_terrain(elevation, terrain):
+    bands = len(terrain)
+    return [[terrain[min(int(value * bands), bands - 1)] for value in row] for row in elevation]
+
+def find_start(terrain_rows):
+    """The passable square closest to the middle of the map."""
+    y_size, x_size = len(terrain_rows), len(terrain_rows[0])
+    center_x, center_y = x_size // 2, y_size // 2
+    passable = [(abs(x - center_x) + abs(y - center_y), x, y) for y, row in enumerate(terrain_rows) for x, t in enumerate(row) if t.passable]
+    if not passable:
+        raise ValueError('The generated map has no passable terrain.')
+    distance, x, y = min(passable)
+    return x, y
+
+def generate_world(name, x_size, y_size, level_min=0, terrain=None, seed=None, scale=16, max_battle_odds=50, safe_radius=2, batch_size=1000):
+    """Procedurally build a WorldMap and all of its squares, written with batched bulk inserts in one transaction."""
+    rng = random.Random(seed)
+    terrain = terrain or default_terrain_order()
+    terrain_rows = assign_terrain(value_noise(x_size, y_size, scale, rng.random()), terrain)
+    danger = value_noise(x_size, y_size, scale, rng.random())
+    start_x, start_y = find_start(terrain_rows)
+
+    with transaction.commit_on_success():
+        # start has to point somewhere until the squares exist; it is fixed below, before the transaction commits.
+        world_map = WorldMap.objects.create(name=name, level_min=level_min, x_size=x_size, y_size=y_size, start_id=1)
+
+        def squares():
+            for y in xrange(y_size):
+                for x in xrange(x_size):
+                    safe = abs(x - start_x) <= safe_radius and abs(y - start_y) <= safe_radius
+                    battle_odds = 0 if safe else int(round(danger[y][x] * max_battle_odds))
+                    yield MapSquare(world_map=world_map, x=x, y=y, terrain=terrain_rows[y][x], battle_odds=battle_odds, safe=safe)
+
+        for batch in batches(squares(), batch_size):
+            MapSquare.objects.bulk_create(batch)
+
+        world_map.start = world_map.mapsquare_set.get(x=start_x, y=start_y)
+        world_map.save(update_fields=['start',]) # also invalidates any cached copy of the map.
+    return world_map
@@ -0,0 +1,122 @@
+from array import array
+
+from .mapcache import map_version
+from .models import MapSquare, Terrain, WorldMap
+
+# direction, x offset, y offset
+DIRECTIONS = (
+    ('N', 0, -1),
+    ('S', 0, 1),
+    ('W', -1, 0),
+    ('E', 1, 0),
+)
+
+DIRECTION_NAMES = {'N': 'North', 'S': 'South', 'W': 'West', 'E': 'East'}
+OPPOSITE_DIRECTIONS = {'N': 'S', 'S': 'N', 'W': 'E', 'E': 'W'}
+DIRECTION_OFFSETS = dict((direction, (dx, dy)) for direction, dx, dy in DIRECTIONS)
+
+_grids = {} # world_map_id -> MapGrid, per process.
+
+class MapGrid(object):
+    """A compact, in-memory copy of a WorldMap's squares.  Cells are stored row by row in flat arrays so neighbour,
+    passability and possible-move lookups never touch the database once the grid has been built."""
+
+    def __init__(self, world_map, version=None):
+        self.world_map = world_map
+        self.version = version
+        self.world_map_id = world_map.pk
+        self.x_size = world_map.x_size
+        self.y_size = world_map.y_size
+        self.terrain = dict((t.pk, t) for t in Terrain.objects.all())
+
+        cells = self.x_size * self.y_size
+        self.square_ids = array('l', [0]) * cells # 0 means there is no square in that cell.
+        self.terrain_ids = array('l', [0]) * cells
+        self.battle_odds = array('l', [0]) * cells
+        self.turns = array('l', [0]) * cells
+        self.passable = bytearray(cells)
+        self.safe = bytearray(cells)
+
+        squares = MapSquare.objects.filter(world_map=world_map).order_by().values_list('id', 'x', 'y', 'terrain', 'battle_odds', 'safe')
+        for square_id, x, y, terrain_id, battle_odds, safe in squares:
+            i = self.index(x, y)
+            if i is None:
+                continue
+            self.square_ids[i] = square_id
+            self.terrain_ids[i] = terrain_id
+            self.battle_odds[i] = battle_odds
+            self.turns[i] = self.terrain[terrain_id].turns
+            self.passable[i] = self.terrain[terrain_id].passable
+            self.safe[i] = safe
+
+    def index(self, x, y):
+        if 0 <= x < self.x_size and 0 <= y < self.y_size:
+            return y * self.x_size + x
+        return None
+
+    def square_id(self, x, y):
+        i = self.index(x, y)
+        if i is None:
+            return None
+        return self.square_ids[i] or None
+
+    def terrain_at(self, x, y):
+        i = self.index(x, y)
+        if i is None or not self.square_ids[i]:
+            return None
+        return self.terrain[self.terrain_ids[i]]
+
+    def is_passable(self, x, y):
+        i = self.index(x, y)
+        if i is None or not self.square_ids[i]:
+            return False
+        return bool(self.passable[i])
+
+    def square(self, x, y):
+        """Build a read-only MapSquare for x/y (with its terrain and map already cached) without querying.  Never save it."""
+        i = self.index(x, y)
+        if i is None or not self.square_ids[i]:
+            return None
+        map_square = MapSquare(id=self.square_ids[i], world_map_id=self.world_map_id, x=x, y=y, terrain_id=self.terrain_ids[i], battle_odds=self.battle_odds[i], safe=bool(self.safe[i]))
+        setattr(map_square, MapSquare._meta.get_field('terrain').get_cache_name(), self.terrain[self.terrain_ids[i]])
+        setattr(map_square, MapSquare._meta.get_field('world_map').get_cache_name(), self.world_map)
+        return map_square
+
+    def square_ids_within(self, x, y, radius):
+        """Ids of the squares no more than radius squares from x/y, read straight from the grid rows."""
+        square_ids = []
+        x_min, x_max = max(x - radius, 0), min(x + radius, self.x_size - 1)
+        for row in xrange(max(y - radius, 0), min(y + radius, self.y_size - 1) + 1):
+            square_ids.extend(square_id for square_id in self.square_ids[row * self.x_size + x_min:row * self.x_size + x_max + 1] if square_id)
+        return square_ids
+    
+    def step(self, x, y, direction):
+        dx, dy = DIRECTION_OFFSETS[direction]
+        return x + dx, y + dy
+
+    def neighbours(self, x, y):
+        for direction, dx, dy in DIRECTIONS:
+            yield direction, x + dx, y + dy
+
+    def possible_moves(self, x, y):
+        possible_moves = {}
+        for direction, next_x, next_y in self.neighbours(x, y):
+            map_square = self.square(next_x, next_y)
+            if map_square is not None:
+                possible_moves[direction] = map_square
+        return possible_moves
+
+def get_grid(world_map_id):
+    # the map version is shared through the cache, so edits made in other processes are picked up too.
+    version = map_version(world_map_id)
+    grid = _grids.get(world_map_id)
+    if grid is None or grid.version != version:
+        grid = _grids[world_map_id] = MapGrid(WorldMap.objects.get(pk=world_map_id), version)
+    return grid
+
+def invalidate_grid(world_map_id=None):
+    """Drop the cached grid for one map, or every map when no id is given."""
+    if world_map_id is None:
+        _grids.clear()
+    else:
+        _grids.pop(world_map_id, None)
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+from world.mapfile import export_map
+from world.models import WorldMap
+
+import codecs, sys
+
+class Command(BaseCommand):
+    args = '<world_map_id> [file]'
+    help = 'Export a world map to a text map file, or to stdout.'
+
+    def handle(self, *args, **options):
+        if len(args) not in (1, 2):
+            raise CommandError('Usage: export_map {args}'.format(args=self.args))
+        try:
+            world_map = WorldMap.objects.get(pk=args[0])
+        except (WorldMap.DoesNotExist, ValueError):
+            raise CommandError('World map {id} does not exist.'.format(id=args[0]))
+
+        if len(args) == 2 and args[1] != '-':
+            with codecs.open(args[1], 'w', encoding='utf-8') as out:
+                export_map(world_map, out)
+        else:
+            export_map(world_map, codecs.getwriter('utf-8')(sys.stdout))
@@ -0,0 +1,63 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from world.generation import generate_world
+from world.models import Terrain
+
+import logging, time
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    args = '<name> <x_size> <y_size>'
+    help = 'Procedurally generate a new world map.'
+    option_list = BaseCommand.option_list + (
+        make_option('--level-min', type='int', default=0, help='Minimum player level for the map.'),
+        make_option('--seed', type='int', default=None, help='Random seed, to generate the same map again.'),
+        make_option('--scale', type='int', default=16, help='Rough size, in squares, of terrain features.'),
+        make_option('--terrain', default=None, help='Comma separated terrain ids from the lowest to the highest ground.'),
+        make_option('--max-battle-odds', type='int', default=50),
+        make_option('--safe-radius', type='int', default=2, help='Squares around the start that are safe from fights.'),
+        make_option('--batch-size', type='int', default=1000),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 3:
+            raise CommandError('Usage: generate_world {args}'.format(args=self.args))
+        name = args[0]
+        try:
+            x_size, y_size = int(args[1]), int(args[2])
+        except ValueError:
+            raise CommandError('x_size and y_size must be numbers.')
+        if x_size < 1 or y_size < 1:
+            raise CommandError('x_size and y_size must be at least 1.')
+
+        terrain = None
+        if options['terrain']:
+            try:
+                terrain_ids = [int(pk) for pk in options['terrain'].split(',')]
+            except ValueError:
+                raise CommandError('--terrain must be a comma separated list of terrain ids.')
+            terrain_by_id = Terrain.objects.in_bulk(terrain_ids)
+            try:
+                terrain = [terrain_by_id[pk] for pk in terrain_ids]
+            except KeyError as e:
+                raise CommandError('Unknown terrain {pk}.'.format(pk=e))
+        elif not Terrain.objects.exists():
+            raise CommandError('There is no terrain to build a map from.  Add some first (e.g. manage.py loaddata mapdata).')
+
+        started = time.time()
+        try:
+            world_map = generate_world(name, x_size, y_size,
+                level_min=options['level_min'],
+                terrain=terrain,
+                seed=options['seed'],
+                scale=options['scale'],
+                max_battle_odds=options['max_battle_odds'],
+                safe_radius=options['safe_radius'],
+                batch_size=options['batch_size'],
+            )
+        except ValueError as e:
+            raise CommandError(e)
+
+        logger.info('generated world map {id} ({x_size}x{y_size}) in {seconds:.1f}s.'.format(id=world_map.pk, x_size=x_size, y_size=y_size, seconds=time.time() - started))
+        self.stdout.write('Created world map {id}: {name} ({x_size}x{y_size}), starting at {start}.'.format(id=world_map.pk, name=world_map.name, x_size=x_size, y_size=y_size, start=world_map.start))
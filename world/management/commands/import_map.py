@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+from optparse import make_option
+from world.mapfile import MapFormatException, import_map
+
+import codecs, sys
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Create a new world map from a text map file ("-" reads stdin).'
+    option_list = BaseCommand.option_list + (
+        make_option('--name', default=None, help='Name the map something other than the name in the file.'),
+        make_option('--batch-size', type='int', default=1000),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Usage: import_map {args}'.format(args=self.args))
+
+        if args[0] == '-':
+            lines = codecs.getreader('utf-8')(sys.stdin)
+        else:
+            try:
+                lines = codecs.open(args[0], 'r', encoding='utf-8')
+            except IOError as e:
+                raise CommandError(e)
+
+        try:
+            world_map = import_map(lines, name=options['name'], batch_size=options['batch_size'])
+        except MapFormatException as e:
+            raise CommandError(e)
+        finally:
+            lines.close()
+
+        self.stdout.write('Created world map {id}: {name} ({x_size}x{y_size}).'.format(id=world_map.pk, name=world_map.name, x_size=world_map.x_size, y_size=world_map.y_size))
@@ -0,0 +1,143 @@
+from django.core.cache import cache
+from django.template.defaultfilters import slugify
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+import hashlib, json, time
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 30 # versions must outlive anything cached under them.
+ROW_TIMEOUT = 60 * 60 * 24
+
+TERRAIN_VERSION_KEY = 'world:terrain:version'
+UNREACHABLE_VERSION = 0 # stands in for versions while the cache is down; real ones start from the clock.
+MISSING_SQUARE_HTML = mark_safe('<a href="#" class="unpassable"> X </a>')
+
+# one printable, json-safe character per terrain in the packed map data.  a space marks a missing square.
+PALETTE = ''.join(chr(c) for c in xrange(0x23, 0x7f) if chr(c) != '\\')
+
+def _get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # start from the clock so a lost version key can never bring back markup cached under an older version.
+        cache.add(key, int(time.time() * 1000), VERSION_TIMEOUT)
+        version = cache.get(key)
+    if version is None:
+        # the cache is unreachable.  a steady version keeps urls built from it valid (a clock would redirect forever);
+        # once the cache is back the version starts from the clock again.  see cacheable().
+        version = UNREACHABLE_VERSION
+    return version
+
+def _bump_version(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, int(time.time() * 1000), VERSION_TIMEOUT)
+
+def _map_version_key(world_map_id):
+    return 'world:map:{id}:version'.format(id=world_map_id)
+
+def map_version(world_map_id):
+    """Changes whenever a square of the map, the map itself or any terrain changes."""
+    return '{map}.{terrain}'.format(map=_get_version(_map_version_key(world_map_id)), terrain=_get_version(TERRAIN_VERSION_KEY))
+
+def cacheable(version):
+    """Whether what a map_version() names can be cached for good.  Not while the cache is down: the stand-in version
+    stays the same across edits and across outages."""
+    return str(UNREACHABLE_VERSION) not in version.split('.')
+
+def bump_map_version(world_map_id):
+    _bump_version(_map_version_key(world_map_id))
+
+def bump_terrain_version():
+    _bump_version(TERRAIN_VERSION_KEY)
+
+def square_html(map_square, player=False):
+    if map_square is None:
+        return MISSING_SQUARE_HTML
+    if player:
+        return format_html('<a href="#" class="{0} player"> & </a>', slugify(map_square.terrain.name))
+    return format_html('<a href="#" class="{0}"> {1} </a>', slugify(map_square.terrain.name), map_square.terrain.character)
+
+def _row_key(world_map_id, version, y):
+    return 'world:map:{id}:{version}:row:{y}'.format(id=world_map_id, version=version, y=y)
+
+def get_map_rows(world_map, y_min, y_max):
+    """The terrain markup of every row from y_min to y_max, as lists of square html.  Rows are rendered once per map
+    version and shared through the cache; missing rows are loaded with a single range query."""
+    version = map_version(world_map.pk)
+    keys = dict((_row_key(world_map.pk, version, y), y) for y in xrange(y_min, y_max + 1))
+    rows = dict((keys[key], row) for key, row in cache.get_many(keys.keys()).items())
+
+    missing = [y for y in xrange(y_min, y_max + 1) if y not in rows]
+    if missing:
+        fresh = {}
+        layout = world_map.map_layout(0, missing[0], world_map.x_size - 1, missing[-1])
+        for y, map_squares in enumerate(layout, missing[0]):
+            if y not in rows:
+                rows[y] = fresh[_row_key(world_map.pk, version, y)] = [square_html(map_square) for map_square in map_squares]
+        cache.set_many(fresh, ROW_TIMEOUT)
+
+    return [rows[y] for y in xrange(y_min, y_max + 1)]
+
+def render_map(world_map, x_min, y_min, x_max, y_max, player_square=None):
+    """Cached terrain markup for the window, with the player marker laid over player_square."""
+    x_min, y_min = max(x_min, 0), max(y_min, 0)
+    x_max, y_max = min(x_max, world_map.x_size - 1), min(y_max, world_map.y_size - 1)
+
+    lines = []
+    for y, row in enumerate(get_map_rows(world_map, y_min, y_max), y_min):
+        row = row[x_min:x_max + 1]
+        if player_square is not None and player_square.world_map_id == world_map.pk and player_square.y == y and x_min <= player_square.x <= x_max:
+            row = list(row)
+            row[player_square.x - x_min] = square_html(player_square, player=True)
+        lines.append(u''.join(row))
+    return mark_safe(u''.join(line + u'<br/>' for line in lines))
+
+def get_terrain_stylesheet():
+    """The terrain stylesheet and a digest of its content, regenerated only when the terrain version changes."""
+    from .models import Terrain
+    key = 'world:terrain:{version}:stylesheet'.format(version=_get_version(TERRAIN_VERSION_KEY))
+    stylesheet = cache.get(key)
+    if stylesheet is None:
+        css = render_to_string('world_map/terrain.css', {'terrain': Terrain.objects.all()})
+        stylesheet = (css, hashlib.md5(css.encode('utf-8')).hexdigest()[:12])
+        cache.set(key, stylesheet, VERSION_TIMEOUT)
+    return stylesheet
+
+def get_map_data(world_map_id):
+    """The version and packed json terrain data of a map.  Each row is a string with one palette character per
+    square, indexing into the terrain list."""
+    from .grid import get_grid
+    grid = get_grid(world_map_id)
+    key = 'world:map:{id}:{version}:data'.format(id=world_map_id, version=grid.version)
+    data = cache.get(key)
+    if data is None:
+        terrain_ids = sorted(grid.terrain.keys())
+        if len(terrain_ids) > len(PALETTE):
+            raise ValueError('Too many terrain types to pack the map.')
+        codes = dict((terrain_id, PALETTE[i]) for i, terrain_id in enumerate(terrain_ids))
+
+        rows = []
+        for y in xrange(grid.y_size):
+            start = y * grid.x_size
+            rows.append(''.join(codes[terrain_id] if square_id else ' ' for square_id, terrain_id in zip(grid.square_ids[start:start + grid.x_size], grid.terrain_ids[start:start + grid.x_size])))
+
+        data = json.dumps({
+            'id': grid.world_map_id,
+            'version': grid.version,
+            'x_size': grid.x_size,
+            'y_size': grid.y_size,
+            'terrain': [{
+                'id': t.pk,
+                'name': t.name,
+                'slug': slugify(t.name),
+                'character': t.character,
+                'fg_color': t.fg_color,
+                'bg_color': t.bg_color,
+                'passable': t.passable,
+            } for t in (grid.terrain[terrain_id] for terrain_id in terrain_ids)],
+            'rows': rows,
+        }, separators=(',', ':'))
+        cache.set(key, data, ROW_TIMEOUT)
+    return grid.version, data
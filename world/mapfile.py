@@ -0,0 +1,176 @@
+"""
+Plain text map format, one character per square.
+
+    name: Begintopia
+    level_min: 0
+    size: 10x10
+    start: 4,4
+    battle_odds: 10
+    safe: yes
+    terrain: ` Grass
+    terrain: ^ Forest
+    override: 3,4 30 no
+    map:
+    `````^^^^^
+    ...
+
+The terrain lines map each character to a Terrain by name; the character is the terrain's own unless two terrains share
+one.  Squares whose battle_odds/safe differ from the map defaults get an override line.  A space is a missing square.
+"""
+from django.db import transaction
+from django.db.models import Count
+
+from .models import MapSquare, Terrain, WorldMap
+from .utils import batches
+
+import string
+
+class MapFormatException(Exception):
+    pass
+
+MISSING = ' '
+SPARE_CHARACTERS = string.ascii_letters + string.digits + string.punctuation
+
+def _yes_no(value):
+    return 'yes' if value else 'no'
+
+def _parse_yes_no(value):
+    if value not in ('yes', 'no'):
+        raise MapFormatException('Expected yes or no, got "{value}".'.format(value=value))
+    return value == 'yes'
+
+def terrain_legend(terrain):
+    """Pick a unique character per terrain, preferring the terrain's own."""
+    legend = {}
+    taken = set()
+    for t in sorted(terrain, key=lambda t: t.pk):
+        character = t.character
+        if not character or character in taken or character == MISSING:
+            character = next(c for c in SPARE_CHARACTERS if c not in taken)
+        taken.add(character)
+        legend[t.pk] = character
+    return legend
+
+def export_map(world_map, out):
+    """Stream world_map to the file-like object out."""
+    terrain = Terrain.objects.all()
+    legend = terrain_legend(terrain)
+    defaults = world_map.mapsquare_set.order_by().values('battle_odds', 'safe').annotate(squares=Count('id')).order_by('-squares')[:1]
+    default_odds, default_safe = (defaults[0]['battle_odds'], defaults[0]['safe']) if defaults else (0, False)
+
+    out.write(u'name: {name}\n'.format(name=world_map.name))
+    out.write(u'level_min: {level_min}\n'.format(level_min=world_map.level_min))
+    out.write(u'size: {x_size}x{y_size}\n'.format(x_size=world_map.x_size, y_size=world_map.y_size))
+    starts = world_map.mapsquare_set.filter(pk=world_map.start_id)[:1]
+    if starts:
+        out.write(u'start: {x},{y}\n'.format(x=starts[0].x, y=starts[0].y))
+    out.write(u'battle_odds: {odds}\n'.format(odds=default_odds))
+    out.write(u'safe: {safe}\n'.format(safe=_yes_no(default_safe)))
+    for t in terrain:
+        out.write(u'terrain: {character} {name}\n'.format(character=legend[t.pk], name=t.name))
+
+    overrides = world_map.mapsquare_set.exclude(battle_odds=default_odds, safe=default_safe).order_by('y', 'x').values_list('x', 'y', 'battle_odds', 'safe')
+    for x, y, battle_odds, safe in overrides.iterator():
+        out.write(u'override: {x},{y} {odds} {safe}\n'.format(x=x, y=y, odds=battle_odds, safe=_yes_no(safe)))
+
+    out.write(u'map:\n')
+    squares = world_map.mapsquare_set.order_by('y', 'x').values_list('x', 'y', 'terrain').iterator()
+    row, current_y = [MISSING] * world_map.x_size, 0
+    for x, y, terrain_id in squares:
+        if not (0 <= x < world_map.x_size and 0 <= y < world_map.y_size):
+            continue
+        while current_y < y: # write out every row before this square.
+            out.write(u''.join(row).rstrip() + u'\n')
+            row, current_y = [MISSING] * world_map.x_size, current_y + 1
+        row[x] = legend[terrain_id]
+    while current_y < world_map.y_size:
+        out.write(u''.join(row).rstrip() + u'\n')
+        row, current_y = [MISSING] * world_map.x_size, current_y + 1
+
+def _read_header(lines):
+    header = {'terrain': {}, 'override': {}}
+    for line_number, line in lines:
+        line = line.rstrip('\r\n')
+        if not line.strip() or line.startswith('#'):
+            continue
+        key, separator, value = line.partition(':')
+        if not separator:
+            raise MapFormatException('Line {line}: expected "key: value".'.format(line=line_number))
+        value = value.strip()
+
+        if key == 'map':
+            return header
+        elif key == 'terrain':
+            character, name = value[:1], value[2:].strip()
+            header['terrain'][character] = name
+        elif key == 'override':
+            try:
+                position, battle_odds, safe = value.split()
+                x, y = [int(n) for n in position.split(',')]
+                header['override'][(x, y)] = (int(battle_odds), _parse_yes_no(safe))
+            except ValueError:
+                raise MapFormatException('Line {line}: expected "override: x,y battle_odds yes|no".'.format(line=line_number))
+        elif key in ('name', 'level_min', 'size', 'start', 'battle_odds', 'safe'):
+            header[key] = value
+        else:
+            raise MapFormatException('Line {line}: unknown key "{key}".'.format(line=line_number, key=key))
+    raise MapFormatException('No "map:" section found.')
+
+def import_map(lines, name=None, batch_size=1000):
+    """Create a new WorldMap from the lines of a map file, writing its squares with batched bulk inserts in one
+    transaction."""
+    lines = enumerate(lines, 1)
+    header = _read_header(lines)
+    try:
+        x_size, y_size = [int(n) for n in header['size'].split('x')]
+        level_min = int(header.get('level_min', 0))
+        default_odds = int(header.get('battle_odds', 0))
+        default_safe = _parse_yes_no(header.get('safe', 'no'))
+        start = tuple(int(n) for n in header['start'].split(',')) if 'start' in header else None
+    except (KeyError, ValueError):
+        raise MapFormatException('The header needs a "size: XxY" and numeric level_min, battle_odds and start values.')
+
+    terrain_by_name = dict((t.name, t) for t in Terrain.objects.all())
+    terrain = {}
+    for character, terrain_name in header['terrain'].items():
+        if terrain_name not in terrain_by_name:
+            raise MapFormatException('Unknown terrain "{name}".'.format(name=terrain_name))
+        terrain[character] = terrain_by_name[terrain_name]
+    for t in terrain_by_name.values(): # fall back to the terrain's own character.
+        terrain.setdefault(t.character, t)
+
+    with transaction.commit_on_success():
+        world_map = WorldMap.objects.create(name=name or header.get('name', 'Imported'), level_min=level_min, x_size=x_size, y_size=y_size, start_id=1)
+
+        def squares():
+            for y, (line_number, line) in enumerate(lines):
+                line = line.rstrip('\r\n')
+                if y >= y_size:
+                    if line.strip():
+                        raise MapFormatException('Line {line}: the map has more than {rows} rows.'.format(line=line_number, rows=y_size))
+                    continue
+                if len(line) > x_size:
+                    raise MapFormatException('Line {line}: the row is wider than {columns} squares.'.format(line=line_number, columns=x_size))
+                for x, character in enumerate(line):
+                    if character == MISSING:
+                        continue
+                    if character not in terrain:
+                        raise MapFormatException('Line {line}: unknown terrain "{character}".'.format(line=line_number, character=character))
+                    battle_odds, safe = header['override'].get((x, y), (default_odds, default_safe))
+                    yield MapSquare(world_map=world_map, x=x, y=y, terrain=terrain[character], battle_odds=battle_odds, safe=safe)
+
+        for batch in batches(squares(), batch_size):
+            MapSquare.objects.bulk_create(batch)
+
+        if start is not None:
+            try:
+                world_map.start = world_map.mapsquare_set.get(x=start[0], y=start[1])
+            except MapSquare.DoesNotExist:
+                raise MapFormatException('There is no square at the start position {x},{y}.'.format(x=start[0], y=start[1]))
+        else:
+            squares = world_map.mapsquare_set.order_by('y', 'x')[:1]
+            if not squares:
+                raise MapFormatException('The map has no squares.')
+            world_map.start = squares[0]
+        world_map.save(update_fields=['start',]) # also invalidates any cached copy of the map.
+    return world_map
@@ -1,10 +1,12 @@
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.timezone import now
 
-from game.models import DatesMixin
+from game.models import ActivityEntryMixin, DatesMixin
 
-import datetime
+import operator
 
 class Terrain(DatesMixin):
     name = models.CharField(max_length=20)
@@ -37,18 +39,56 @@ class WorldMap(DatesMixin):
         return "<a href='{url}' target='_blank'>edit</a>".format(url=reverse("world_map_edit", kwargs={ "world_map_id": self.id }))
     map_editor_url.allow_tags = True
         
-    def full_map_layout(self):
-        map_layout = []
-        for y in xrange(self.y_size):
-            map_layout.append([])
-            for x in xrange(self.x_size):
-                try:
-                    map_layout[y].append(self.mapsquare_set.get(x=x,y=y))
-                except:
-                    map_layout[y].append(None)
+    def map_layout(self, x_min, y_min, x_max, y_max):
+        # load every square (and its terrain) inside the window in one range query, then drop them into a dense grid.  
+        # bounds are inclusive and clamped to the map.  missing squares stay None.
+        x_min, y_min = max(x_min, 0), max(y_min, 0)
+        x_max, y_max = min(x_max, self.x_size - 1), min(y_max, self.y_size - 1)
+        map_layout = [[None] * (x_max - x_min + 1) for y in xrange(y_min, y_max + 1)]
+        squares = self.mapsquare_set.filter(x__range=(x_min, x_max), y__range=(y_min, y_max)).select_related('terrain').order_by()
+        for map_square in squares:
+            map_layout[map_square.y - y_min][map_square.x - x_min] = map_square
 
         return map_layout
 
+    def full_map_layout(self):
+        return self.map_layout(0, 0, self.x_size - 1, self.y_size - 1)
+    
+    def paint(self, positions, terrain=None, battle_odds=None, safe=None):
+        """Set terrain/battle_odds/safe (whichever are given) on every x/y in positions with one UPDATE, creating the
+        missing squares with one bulk insert when a terrain is given.  Returns (updated, created)."""
+        positions = set((x, y) for x, y in positions if 0 <= x < self.x_size and 0 <= y < self.y_size)
+        values = dict((field, value) for field, value in (('terrain', terrain), ('battle_odds', battle_odds), ('safe', safe)) if value is not None)
+        if not positions:
+            return 0, 0
+
+        # a rectangle is a simple range, anything else is grouped into one x__in per row.
+        xs, ys = [x for x, y in positions], [y for x, y in positions]
+        if len(positions) == (max(xs) - min(xs) + 1) * (max(ys) - min(ys) + 1):
+            where = models.Q(x__range=(min(xs), max(xs)), y__range=(min(ys), max(ys)))
+        else:
+            rows = {}
+            for x, y in positions:
+                rows.setdefault(y, []).append(x)
+            where = reduce(operator.or_, (models.Q(y=y, x__in=row) for y, row in rows.items()))
+
+        with transaction.commit_on_success():
+            squares = self.mapsquare_set.filter(where)
+            updated = squares.update(modified_at=now(), **values) if values else 0 # update() skips auto_now.
+            created = []
+            if terrain is not None:
+                missing = positions - set(squares.values_list('x', 'y'))
+                created = [MapSquare(world_map=self, x=x, y=y, terrain=terrain, battle_odds=battle_odds or 0, safe=bool(safe)) for x, y in sorted(missing)]
+                MapSquare.objects.bulk_create(created)
+        squares_changed(self.pk)
+        return updated, len(created)
+
+    def viewport(self, x, y, radius):
+        """Bounds of the (2 * radius + 1) square window centered on x/y, shifted so it stays on the map where possible."""
+        x_min = max(0, min(x - radius, self.x_size - 2 * radius - 1))
+        y_min = max(0, min(y - radius, self.y_size - 2 * radius - 1))
+        return x_min, y_min, x_min + 2 * radius, y_min + 2 * radius
+
 class MapSquare(DatesMixin):
     world_map = models.ForeignKey('WorldMap')
     x = models.SmallIntegerField()
@@ -63,54 +103,86 @@ class MapSquare(DatesMixin):
         unique_together = ('world_map', 'x', 'y') # only one X/Y coordinate per map.
         
     def announce_arrival(self, player, from_direction):
-        from players.models import ActivityLog
-        activity_logs = []
-        for active_player in self.active_players().exclude(pk=player.pk):
-            activity_logs.append(ActivityLog(to_player=active_player, from_player=player, activity_type='arrival', message="You see {player} appear from the {from_direction}.".format(player=player.handle, from_direction=from_direction)))
-        ActivityLog.objects.bulk_create(activity_logs)
-        return
+        return self.announce(player, 'arrival', "You see {player} appear from the {from_direction}.".format(player=player.handle, from_direction=from_direction))
     
     def announce_departure(self, player, to_direction):
-        from players.models import ActivityLog
-        activity_logs = []
-        for active_player in self.active_players().exclude(pk=player.pk):
-            activity_logs.append(ActivityLog(to_player=active_player, from_player=player, activity_type='departure', message="You see {player} wander off to the {to_direction}.".format(player=player.handle, to_direction=to_direction)))
-        ActivityLog.objects.bulk_create(activity_logs)
-        return
+        return self.announce(player, 'departure', "You see {player} wander off to the {to_direction}.".format(player=player.handle, to_direction=to_direction))
+    
+    def announce(self, player, activity_type, message):
+        from .presence import event_posted
+        event = SquareEvent.objects.create(map_square=self, from_player=player, activity_type=activity_type, message=message)
+        event_posted(self, event.pk)
+        return event
+    
+    def active_player_ids(self, exclude=None):
+        from .presence import active_player_ids
+        return active_player_ids(self, exclude=exclude)
         
     def active_players(self):
-        return self.player_set.filter(here_since__gt=now()-datetime.timedelta(minutes=10))
+        active_player_ids = self.active_player_ids()
+        if not active_player_ids:
+            return self.player_set.none()
+        return self.player_set.filter(pk__in=active_player_ids)
+    
+    def get_surrounding_squares(self, radius=1):
+        return MapSquare.objects.filter(world_map=self.world_map_id, x__range=(self.x-radius, self.x+radius), y__range=(self.y-radius, self.y+radius))
     
-    def get_surrounding_squares(self):
-        return MapSquare.objects.filter(world_map=self.world_map, x__gt=self.x-2, x__lt=self.x+2, y__gt=self.y-2, y__lt=self.y+2)
+    def get_surrounding_layout(self, radius):
+        return self.world_map.map_layout(*self.world_map.viewport(self.x, self.y, radius))
         
     def get_possible_moves(self):
-        possible_moves = {}
-        try:
-            possible_moves['N'] = MapSquare.objects.get(world_map=self.world_map, x=self.x, y=self.y-1)
-        except:
-            pass
-
-        try:
-            possible_moves['S'] = MapSquare.objects.get(world_map=self.world_map, x=self.x, y=self.y+1)
-        except:
-            pass
-            
-        try:
-            possible_moves['W'] = MapSquare.objects.get(world_map=self.world_map, x=self.x-1, y=self.y)
-        except:
-            pass
-            
-        try:
-            possible_moves['E'] = MapSquare.objects.get(world_map=self.world_map, x=self.x+1, y=self.y)
-        except:
-            pass
-            
-        return possible_moves
+        from .grid import get_grid
+        return get_grid(self.world_map_id).possible_moves(self.x, self.y)
     
     @property
     def is_passable(self):
         return self.terrain.passable
 
     def __unicode__(self):
-        return "{map}/{x}/{y}".format(map=self.world_map, x=self.x, y=self.y)
\ No newline at end of file
+        return "{map}/{x}/{y}".format(map=self.world_map, x=self.x, y=self.y)
+
+class SquareEvent(ActivityEntryMixin, DatesMixin):
+    """Something everyone on a square can see, like a player arriving or leaving.  One row is written per event no matter
+    how crowded the square is; players merge the events on their square into their activity log when they read it."""
+    ACTIVITY_TYPES = (
+        ('arrival', 'A player walked up.'),
+        ('departure', 'A player left.'),
+    )
+    map_square = models.ForeignKey('MapSquare')
+    from_player = models.ForeignKey('players.Player', related_name='square_events')
+    activity_type = models.CharField(max_length=20, choices=ACTIVITY_TYPES)
+    message = models.TextField()
+    
+    class Meta:
+        ordering = ('-id',)
+        index_together = (('map_square', 'created_at'),)
+        
+    @property
+    def dom_id(self):
+        return 'square_event_{id}'.format(id=self.pk)
+    
+def squares_changed(world_map_id):
+    """Drop the in-memory grid and cached markup of a map.  Call this after bulk writes, which send no signals."""
+    from .grid import invalidate_grid
+    from .mapcache import bump_map_version
+    bump_map_version(world_map_id)
+    invalidate_grid(world_map_id)
+
+# keep the in-memory map grids and the cached map markup in sync with the database.
+@receiver(post_save, sender=MapSquare)
+@receiver(post_delete, sender=MapSquare)
+def map_square_changed(sender, instance, **kwargs):
+    squares_changed(instance.world_map_id)
+
+@receiver(post_save, sender=WorldMap)
+@receiver(post_delete, sender=WorldMap)
+def world_map_changed(sender, instance, **kwargs):
+    squares_changed(instance.pk)
+
+@receiver(post_save, sender=Terrain)
+@receiver(post_delete, sender=Terrain)
+def terrain_changed(sender, instance, **kwargs):
+    from .grid import invalidate_grid
+    from .mapcache import bump_terrain_version
+    bump_terrain_version()
+    invalidate_grid()
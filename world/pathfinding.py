@@ -0,0 +1,52 @@
+from .grid import DIRECTIONS
+
+import heapq
+
+def step_cost(grid, i):
+    # entering a square costs its terrain's turns, and never less than one.
+    return max(grid.turns[i], 1)
+
+def find_path(grid, start, goal, max_cost=None):
+    """A* search over the passable squares of a MapGrid, weighted by Terrain.turns.  Returns (directions, cost) for
+    the cheapest path from start to goal, or None if there is no path (within max_cost)."""
+    start_i, goal_i = grid.index(*start), grid.index(*goal)
+    if start_i is None or goal_i is None or not grid.is_passable(*goal):
+        return None
+    if start_i == goal_i:
+        return [], 0
+
+    goal_x, goal_y = goal
+    def estimate(x, y):
+        return abs(goal_x - x) + abs(goal_y - y)
+
+    costs = {start_i: 0}
+    came_from = {}
+    frontier = [(estimate(*start), 0, start_i, start[0], start[1])]
+    while frontier:
+        priority, cost, i, x, y = heapq.heappop(frontier)
+        if i == goal_i:
+            break
+        if cost > costs[i]: # already reached more cheaply.
+            continue
+        for direction, dx, dy in DIRECTIONS:
+            next_x, next_y = x + dx, y + dy
+            next_i = grid.index(next_x, next_y)
+            if next_i is None or not grid.square_ids[next_i] or not grid.passable[next_i]:
+                continue
+            next_cost = cost + step_cost(grid, next_i)
+            if max_cost is not None and next_cost > max_cost:
+                continue
+            if next_cost < costs.get(next_i, next_cost + 1):
+                costs[next_i] = next_cost
+                came_from[next_i] = (i, direction)
+                heapq.heappush(frontier, (next_cost + estimate(next_x, next_y), next_cost, next_i, next_x, next_y))
+    else:
+        return None
+
+    directions = []
+    i = goal_i
+    while i != start_i:
+        i, direction = came_from[i]
+        directions.append(direction)
+    directions.reverse()
+    return directions, costs[goal_i]
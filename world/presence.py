@@ -0,0 +1,131 @@
+"""
+Who is where, kept in the cache as a spatial hash.  Each WorldMap is cut into CELL_SIZE x CELL_SIZE cells and every
+cell has one bucket of {player_id: (x, y, last seen)}, so "who is within r squares of x/y" reads only the few buckets
+that overlap the area in one get_many and filters them in memory.  A bucket that has dropped out of the cache is
+rebuilt from Player.here_since.  Updates to a bucket take the cell's lock (a cache.add), so two players moving in the
+same cell at once can't write over each other.
+"""
+from contextlib import contextmanager
+from django.core.cache import cache
+from django.utils.timezone import now
+
+from game import pubsub
+
+import calendar, datetime, logging, time
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_SECONDS = 10 * 60 # players who haven't been seen for this long are no longer "here".
+CELL_SIZE = 8
+LOCK_SECONDS = 5 # a process that dies holding a cell's lock only holds it up this long.
+LOCK_WAIT_SECONDS = 1
+
+def _cell_key(world_map_id, cell_x, cell_y):
+    return 'world:presence:{world_map}:{x}:{y}'.format(world_map=world_map_id, x=cell_x, y=cell_y)
+
+def _square_cell_key(map_square):
+    return _cell_key(map_square.world_map_id, map_square.x // CELL_SIZE, map_square.y // CELL_SIZE)
+
+def _event_key(world_map_id, cell_x, cell_y):
+    return 'world:events:{world_map}:{x}:{y}'.format(world_map=world_map_id, x=cell_x, y=cell_y)
+
+def _cells_within(x, y, radius):
+    for cell_x in xrange(max(x - radius, 0) // CELL_SIZE, (x + radius) // CELL_SIZE + 1):
+        for cell_y in xrange(max(y - radius, 0) // CELL_SIZE, (y + radius) // CELL_SIZE + 1):
+            yield cell_x, cell_y
+
+def _active(bucket, at=None):
+    cutoff = (at or time.time()) - ACTIVE_SECONDS
+    return dict((player_id, entry) for player_id, entry in bucket.items() if entry[2] > cutoff)
+
+def _load_cell(world_map_id, cell_x, cell_y):
+    """Rebuild a cell's bucket from the database.  here_since is only flushed every HEARTBEAT_FLUSH_SECONDS, which is
+    close enough next to ACTIVE_SECONDS.  The query is covered by the (map_square, here_since) index on Player."""
+    from players.models import Player
+    from .grid import get_grid
+    grid = get_grid(world_map_id)
+    positions = {} # map_square_id -> (x, y)
+    for y in xrange(cell_y * CELL_SIZE, min((cell_y + 1) * CELL_SIZE, grid.y_size)):
+        for x in xrange(cell_x * CELL_SIZE, min((cell_x + 1) * CELL_SIZE, grid.x_size)):
+            square_id = grid.square_id(x, y)
+            if square_id is not None:
+                positions[square_id] = (x, y)
+    
+    bucket = {}
+    if positions:
+        since = now() - datetime.timedelta(seconds=ACTIVE_SECONDS)
+        for player_id, map_square_id, here_since in Player.objects.filter(map_square__in=positions.keys(), here_since__gte=since).values_list('pk', 'map_square', 'here_since'):
+            x, y = positions[map_square_id]
+            bucket[player_id] = (x, y, calendar.timegm(here_since.utctimetuple()))
+    # add, not set: an update that got in while the database was being read is newer than this.
+    cache.add(_cell_key(world_map_id, cell_x, cell_y), bucket, ACTIVE_SECONDS)
+    return bucket
+
+def _square_bucket(map_square):
+    bucket = cache.get(_square_cell_key(map_square))
+    if bucket is None:
+        bucket = _load_cell(map_square.world_map_id, map_square.x // CELL_SIZE, map_square.y // CELL_SIZE)
+    return bucket
+
+@contextmanager
+def _locked(key):
+    """Hold key's lock for a read-modify-write of its bucket.  If it can't be had within LOCK_WAIT_SECONDS the update
+    goes ahead anyway: a lost entry comes back with the player's next heartbeat, a stuck request doesn't."""
+    lock_key = key + ':lock'
+    deadline = time.time() + LOCK_WAIT_SECONDS
+    locked = cache.add(lock_key, True, LOCK_SECONDS)
+    while not locked and time.time() < deadline:
+        time.sleep(0.01)
+        locked = cache.add(lock_key, True, LOCK_SECONDS)
+    if not locked:
+        logger.warning('presence: gave up waiting for {key}.'.format(key=lock_key))
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+def touch(map_square, player_id):
+    """Record that a player is active on a square right now."""
+    with _locked(_square_cell_key(map_square)):
+        bucket = _active(_square_bucket(map_square))
+        bucket[player_id] = (map_square.x, map_square.y, time.time())
+        cache.set(_square_cell_key(map_square), bucket, ACTIVE_SECONDS)
+
+def leave(map_square, player_id):
+    with _locked(_square_cell_key(map_square)):
+        bucket = _square_bucket(map_square)
+        if bucket.pop(player_id, None) is not None:
+            cache.set(_square_cell_key(map_square), _active(bucket), ACTIVE_SECONDS)
+
+def players_within(world_map_id, x, y, radius, exclude=None):
+    """{player_id: (x, y)} for the players seen in the last ACTIVE_SECONDS no more than radius squares from x/y."""
+    cells = dict((_cell_key(world_map_id, cell_x, cell_y), (cell_x, cell_y)) for cell_x, cell_y in _cells_within(x, y, radius))
+    buckets = cache.get_many(cells.keys())
+    for key in set(cells) - set(buckets):
+        buckets[key] = _load_cell(world_map_id, *cells[key])
+    
+    players = {}
+    at = time.time()
+    for bucket in buckets.values():
+        for player_id, (player_x, player_y, seen) in _active(bucket, at).items():
+            if player_id != exclude and abs(player_x - x) <= radius and abs(player_y - y) <= radius:
+                players[player_id] = (player_x, player_y)
+    return players
+
+def active_player_ids(map_square, exclude=None):
+    """Ids of the players seen on a square in the last ACTIVE_SECONDS."""
+    return players_within(map_square.world_map_id, map_square.x, map_square.y, 0, exclude=exclude).keys()
+
+def event_posted(map_square, event_id):
+    """Note the newest square event in the square's cell, so waiting players can tell something happened nearby."""
+    pubsub.publish(_event_key(map_square.world_map_id, map_square.x // CELL_SIZE, map_square.y // CELL_SIZE), event_id, ACTIVE_SECONDS)
+
+def event_keys(world_map_id, x, y, radius):
+    """The cache keys event_posted publishes to for every cell within radius squares of x/y, to wait on."""
+    return [_event_key(world_map_id, cell_x, cell_y) for cell_x, cell_y in _cells_within(x, y, radius)]
+
+def latest_event_id(world_map_id, x, y, radius):
+    """The newest square event id posted in any cell within radius squares of x/y, or 0."""
+    latest = cache.get_many(event_keys(world_map_id, x, y, radius))
+    return max(latest.values() or [0])
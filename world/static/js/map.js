@@ -1,8 +1,243 @@
+// arrow keys pressed while a move is still in flight are queued up and sent together as one move.
+var queued_directions = '';
+var moving = false;
+
 function move(direction) {
+	if (world_map.data) {
+		queued_directions += direction;
+		if (!moving) {
+			move_in_place({directions: take_queued_directions()});
+		}
+		return;
+	}
 	$('input#direction').val(direction);
 	$('form#direction_form').submit();
 }
 
+function travel(x, y) {
+	if (world_map.data) {
+		return move_in_place({x: x, y: y});
+	}
+	$('input#travel_x').val(x);
+	$('input#travel_y').val(y);
+	$('form#travel_form').submit();
+}
+
+function take_queued_directions() {
+	var directions = queued_directions;
+	queued_directions = '';
+	return directions;
+}
+
+// move without reloading the page: the response carries the new position, possible moves, nearby players and any new activity.
+function move_in_place(data) {
+	moving = true;
+	data.csrfmiddlewaretoken = $('form#direction_form input[name=csrfmiddlewaretoken]').val();
+	data.since_id = latest_activity_id;
+	data.event_since = latest_event_id;
+	$.ajax({
+		url: $('form#direction_form').data('json-action'),
+		type: 'POST',
+		data: data,
+		dataType: 'json',
+		success: function(position) {
+			$('#move-error').empty();
+			if (position.error) { // the walk stopped part way.
+				queued_directions = '';
+				$('#move-error').html($('<div class="alert alert-error"></div>').text(position.error));
+			}
+			world_map.set_player_position(position.x, position.y);
+			$('#possible-moves').html(position.possible_moves_html);
+			$('#other-players-blurb').html(position.other_players_blurb);
+			$('ul#other-players').html(position.other_players_html);
+			world_map.set_players_in_view(position.players_in_view);
+			update_activity_log({objects: position.activity, events: position.events});
+		},
+		error: function(xhr) {
+			var message = 'You stumble and go nowhere.';
+			try {
+				message = $.parseJSON(xhr.responseText).error;
+			} catch (e) {}
+			queued_directions = '';
+			$('#move-error').html($('<div class="alert alert-error"></div>').text(message));
+		},
+		complete: function() {
+			moving = false;
+			if (queued_directions) {
+				move_in_place({directions: take_queued_directions()});
+			}
+		}
+	});
+}
+
+// Draws the map on a canvas from the packed map data, so only the player position changes between moves.
+var world_map = {
+	CELL_SIZE: 32,
+	canvas: null,
+	context: null,
+	data: null,
+	radius: null,
+	x: 0,
+	y: 0,
+	players: {}, // player id -> [x, y] for the other players in view.
+
+	load: function(canvas) {
+		world_map.canvas = canvas;
+		world_map.context = canvas.getContext('2d');
+		world_map.x = parseInt($(canvas).data('x'), 10);
+		world_map.y = parseInt($(canvas).data('y'), 10);
+		world_map.radius = $(canvas).data('radius') === '' ? null : parseInt($(canvas).data('radius'), 10);
+		world_map.players = $(canvas).data('players') || {};
+		$.getJSON($(canvas).data('map-url'), function(data) {
+			world_map.data = data;
+			world_map.draw();
+		});
+	},
+
+	// same window as WorldMap.viewport: centered on the player and shifted to stay on the map.
+	viewport: function() {
+		var data = world_map.data;
+		if (world_map.radius === null) {
+			return {x_min: 0, y_min: 0, x_max: data.x_size - 1, y_max: data.y_size - 1};
+		}
+		var size = 2 * world_map.radius;
+		var x_min = Math.max(0, Math.min(world_map.x - world_map.radius, data.x_size - size - 1));
+		var y_min = Math.max(0, Math.min(world_map.y - world_map.radius, data.y_size - size - 1));
+		return {
+			x_min: x_min,
+			y_min: y_min,
+			x_max: Math.min(x_min + size, data.x_size - 1),
+			y_max: Math.min(y_min + size, data.y_size - 1)
+		};
+	},
+
+	terrain_at: function(x, y) {
+		var code = world_map.data.rows[y].charCodeAt(x);
+		if (code == 32) { // a space means there is no square here.
+			return null;
+		}
+		// palette characters start at '#' and skip the backslash.
+		var index = code - 35;
+		if (code > 92) {
+			index -= 1;
+		}
+		return world_map.data.terrain[index];
+	},
+
+	draw_cell: function(view, x, y) {
+		var context = world_map.context;
+		var size = world_map.CELL_SIZE;
+		var left = (x - view.x_min) * size;
+		var top = (y - view.y_min) * size;
+		var terrain = world_map.terrain_at(x, y);
+
+		context.fillStyle = terrain ? '#' + terrain.bg_color : '#000000';
+		context.fillRect(left, top, size, size);
+		if (x == world_map.x && y == world_map.y) {
+			context.fillStyle = 'yellow';
+			context.fillText('&', left + size / 2, top + size / 2);
+		} else if (world_map.player_at(x, y)) {
+			context.fillStyle = 'white';
+			context.fillText('&', left + size / 2, top + size / 2);
+		} else if (terrain) {
+			context.fillStyle = '#' + terrain.fg_color;
+			context.fillText(terrain.character, left + size / 2, top + size / 2);
+		}
+	},
+
+	draw: function() {
+		var view = world_map.viewport();
+		var size = world_map.CELL_SIZE;
+		world_map.canvas.width = (view.x_max - view.x_min + 1) * size;
+		world_map.canvas.height = (view.y_max - view.y_min + 1) * size;
+		world_map.context.font = (size - 8) + 'px Courier New, monospace';
+		world_map.context.textAlign = 'center';
+		world_map.context.textBaseline = 'middle';
+		for (var y = view.y_min; y <= view.y_max; y++) {
+			for (var x = view.x_min; x <= view.x_max; x++) {
+				world_map.draw_cell(view, x, y);
+			}
+		}
+	},
+
+	player_at: function(x, y) {
+		for (var player_id in world_map.players) {
+			if (world_map.players[player_id][0] == x && world_map.players[player_id][1] == y) {
+				return true;
+			}
+		}
+		return false;
+	},
+
+	// the map square under a click on the canvas.
+	square_at: function(e) {
+		var view = world_map.viewport();
+		var offset = $(world_map.canvas).offset();
+		var scale = world_map.canvas.width / $(world_map.canvas).width();
+		return {
+			x: view.x_min + Math.floor((e.pageX - offset.left) * scale / world_map.CELL_SIZE),
+			y: view.y_min + Math.floor((e.pageY - offset.top) * scale / world_map.CELL_SIZE)
+		};
+	},
+
+	// move the player marker.  only the two changed cells are redrawn unless the viewport has to scroll.
+	set_player_position: function(x, y) {
+		var old_x = world_map.x, old_y = world_map.y;
+		var old_view = world_map.viewport();
+		world_map.x = x;
+		world_map.y = y;
+		if (!world_map.data) {
+			return;
+		}
+		var view = world_map.viewport();
+		if (view.x_min != old_view.x_min || view.y_min != old_view.y_min) {
+			world_map.draw();
+		} else {
+			world_map.draw_cell(view, old_x, old_y);
+			world_map.draw_cell(view, x, y);
+		}
+	},
+
+	set_players_in_view: function(players) {
+		world_map.players = players;
+		if (world_map.data) {
+			world_map.draw();
+		}
+	},
+
+	// follow another player from the arrivals and departures in the activity log.
+	move_other_player: function(item) {
+		var position = world_map.players[item.from_player_id];
+		if (item.activity_type == 'arrival') {
+			world_map.players[item.from_player_id] = [item.x, item.y];
+		} else if (position && position[0] == item.x && position[1] == item.y) { // ignore a departure older than the arrival already seen.
+			delete world_map.players[item.from_player_id];
+		} else {
+			return;
+		}
+		if (world_map.data) {
+			var view = world_map.viewport();
+			if (position) {
+				world_map.draw_cell(view, position[0], position[1]);
+			}
+			world_map.draw_cell(view, item.x, item.y);
+		}
+	}
+};
+
+$(function() {
+	var canvas = document.getElementById('map-canvas');
+	if (canvas && canvas.getContext) {
+		world_map.load(canvas);
+		$(canvas).click(function(e) {
+			var square = world_map.square_at(e);
+			if (square.x != world_map.x || square.y != world_map.y) {
+				travel(square.x, square.y);
+			}
+		});
+	}
+});
+
 $(document).keydown(function(e){
     if (e.keyCode == 37) {  // left arrow
        move('W');
@@ -20,4 +255,4 @@ $(document).keydown(function(e){
        move('S');
        return false;
     }
-});
\ No newline at end of file
+});
@@ -0,0 +1,53 @@
+// Paint mode for the world map editor: collect the selected squares and post them to the paint endpoint in one go.
+var selected = {};
+var last_selected = null;
+
+function update_selection() {
+	var squares = Object.keys(selected);
+	$('#id_squares').val(squares.join(';'));
+	$('#paint_count').text(squares.length);
+}
+
+function toggle_square(link, select) {
+	var key = $(link).data('x') + ',' + $(link).data('y');
+	if (select === undefined) {
+		select = !(key in selected);
+	}
+	if (select) {
+		selected[key] = true;
+		$(link).addClass('selected');
+	} else {
+		delete selected[key];
+		$(link).removeClass('selected');
+	}
+}
+
+$('.map a').click(function(e) {
+	if (!$('#paint_mode').is(':checked')) {
+		return true; // open the square in the admin as usual.
+	}
+	if (e.shiftKey && last_selected) {
+		var x_min = Math.min($(last_selected).data('x'), $(this).data('x'));
+		var x_max = Math.max($(last_selected).data('x'), $(this).data('x'));
+		var y_min = Math.min($(last_selected).data('y'), $(this).data('y'));
+		var y_max = Math.max($(last_selected).data('y'), $(this).data('y'));
+		$('.map a').each(function() {
+			var x = $(this).data('x'), y = $(this).data('y');
+			if (x >= x_min && x <= x_max && y >= y_min && y <= y_max) {
+				toggle_square(this, true);
+			}
+		});
+	} else {
+		toggle_square(this);
+	}
+	last_selected = this;
+	update_selection();
+	return false;
+});
+
+$('#paint_clear').click(function() {
+	$('.map a.selected').removeClass('selected');
+	selected = {};
+	last_selected = null;
+	update_selection();
+});
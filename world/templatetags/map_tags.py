@@ -1,6 +1,9 @@
 from django import template
+from django.core.urlresolvers import reverse
 from django.template.defaultfilters import stringfilter
 
+from world.mapcache import get_terrain_stylesheet
+
 register = template.Library()
 
 @register.filter
@@ -14,4 +17,9 @@ def direction_name(direction):
     if d == 'E':
         return 'East'
     if d == 'W':
-        return 'West'
\ No newline at end of file
+        return 'West'
+
+@register.simple_tag
+def terrain_stylesheet_url():
+    css, digest = get_terrain_stylesheet()
+    return reverse('terrain_stylesheet', kwargs={'digest': digest})
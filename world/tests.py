@@ -5,7 +5,24 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.test.utils import override_settings
+from django.utils.timezone import now
+
+from .admin import MapPaintForm
+from .generation import generate_world
+from .grid import get_grid, invalidate_grid
+from .mapcache import PALETTE, get_terrain_stylesheet, map_version, render_map
+from .mapfile import MapFormatException, export_map, import_map
+from .models import MapSquare, Terrain, WorldMap
+from .pathfinding import find_path
+
+from StringIO import StringIO
+
+import json
 
 
 class SimpleTest(TestCase):
@@ -14,3 +31,276 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class WorldMapLayoutTest(TestCase):
+    fixtures = ['mapdata']
+
+    def test_full_map_layout_single_query(self):
+        world_map = WorldMap.objects.get(pk=1)
+        with self.assertNumQueries(1):
+            layout = world_map.full_map_layout()
+            terrain = [map_square.terrain.name for row in layout for map_square in row if map_square]
+
+        self.assertEqual(len(layout), world_map.y_size)
+        self.assertEqual(len(layout[0]), world_map.x_size)
+        self.assertEqual(len(terrain), world_map.mapsquare_set.count())
+
+    def test_full_map_layout_missing_squares(self):
+        world_map = WorldMap.objects.get(pk=1)
+        world_map.mapsquare_set.filter(x=3, y=4).delete()
+        layout = world_map.full_map_layout()
+        self.assertIsNone(layout[4][3])
+        self.assertEqual((layout[4][2].x, layout[4][2].y), (2, 4))
+
+    def test_map_layout_window(self):
+        world_map = WorldMap.objects.get(pk=1)
+        with self.assertNumQueries(1):
+            layout = world_map.map_layout(*world_map.viewport(8, 1, 2))
+
+        self.assertEqual(len(layout), 5)
+        self.assertEqual(len(layout[0]), 5)
+        self.assertEqual((layout[0][0].x, layout[0][0].y), (5, 0))
+        self.assertEqual((layout[-1][-1].x, layout[-1][-1].y), (9, 4))
+
+    def test_surrounding_squares(self):
+        map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.assertEqual(map_square.get_surrounding_squares().count(), 9)
+        self.assertEqual(map_square.get_surrounding_squares(radius=2).count(), 25)
+
+
+class MapGridTest(TestCase):
+    fixtures = ['mapdata']
+
+    def setUp(self):
+        invalidate_grid()
+
+    def test_possible_moves_match_database(self):
+        map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        grid = get_grid(1)
+        with self.assertNumQueries(0):
+            possible_moves = map_square.get_possible_moves()
+            terrain = dict((direction, square.terrain.name) for direction, square in possible_moves.items())
+
+        for direction, x, y in grid.neighbours(4, 4):
+            expected = MapSquare.objects.get(world_map=1, x=x, y=y)
+            self.assertEqual(possible_moves[direction].pk, expected.pk)
+            self.assertEqual(terrain[direction], expected.terrain.name)
+            self.assertEqual(grid.is_passable(x, y), expected.terrain.passable)
+
+    def test_edges_and_missing_squares(self):
+        MapSquare.objects.filter(world_map=1, x=1, y=0).delete()
+        grid = get_grid(1)
+        self.assertEqual(sorted(grid.possible_moves(0, 0).keys()), ['S'])
+        self.assertIsNone(grid.square(-1, 0))
+        self.assertFalse(grid.is_passable(1, 0))
+
+    def test_invalidated_on_save(self):
+        grid = get_grid(1)
+        map_square = MapSquare.objects.get(world_map=1, x=2, y=2)
+        map_square.terrain = Terrain.objects.filter(passable=False)[0]
+        map_square.save()
+        self.assertIsNot(get_grid(1), grid)
+        self.assertFalse(get_grid(1).is_passable(2, 2))
+
+
+class WorldMapViewTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        from players.models import Player
+        self.player = Player.objects.create_user('viewer@example.com', 'View', 'Er', 'viewer', 'F', 'password')
+        self.player.map_square = MapSquare.objects.get(world_map=1, x=4, y=4)
+        self.player.save()
+        self.client.login(email='viewer@example.com', password='password')
+
+    @override_settings(MAP_RENDERER='html')
+    def test_main(self):
+        response = self.client.get(reverse('world_map_main', kwargs={'world_map_id': 1}))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'player"> & </a>', count=1)
+
+    def test_main_canvas(self):
+        response = self.client.get(reverse('world_map_main', kwargs={'world_map_id': 1}))
+        self.assertContains(response, 'id="map-canvas"')
+        self.assertContains(response, reverse('world_map_data', kwargs={'world_map_id': 1, 'version': map_version(1)}))
+
+    def test_main_without_cache(self):
+        from django.core.cache import get_cache
+        from . import mapcache
+        working_cache, mapcache.cache = mapcache.cache, get_cache('django.core.cache.backends.dummy.DummyCache')
+        try:
+            self.assertEqual(map_version(1), '0.0')
+            response = self.client.get(reverse('world_map_main', kwargs={'world_map_id': 1}))
+            self.assertContains(response, reverse('world_map_data', kwargs={'world_map_id': 1, 'version': '0.0'}))
+            # the same url will name other content later, so it isn't kept.
+            response = self.client.get(reverse('world_map_data', kwargs={'world_map_id': 1, 'version': '0.0'}))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('no-cache', response['Cache-Control'])
+            self.assertNotIn('max-age', response['Cache-Control'])
+            self.assertFalse(response.has_header('ETag'))
+        finally:
+            mapcache.cache = working_cache
+
+    def test_map_data(self):
+        version = map_version(1)
+        url = reverse('world_map_data', kwargs={'world_map_id': 1, 'version': version})
+        response = self.client.get(url)
+        data = json.loads(response.content)
+        self.assertEqual(len(data['rows']), 10)
+        terrain = data['terrain'][PALETTE.index(data['rows'][4][3])]
+        self.assertEqual(terrain['id'], MapSquare.objects.get(world_map=1, x=3, y=4).terrain_id)
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+        map_square = MapSquare.objects.get(world_map=1, x=0, y=0)
+        map_square.terrain = Terrain.objects.get(name='Rocky')
+        map_square.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH='"{version}"'.format(version=version))
+        self.assertRedirects(response, reverse('world_map_data', kwargs={'world_map_id': 1, 'version': map_version(1)}))
+
+    def test_map_markup_cached_until_terrain_changes(self):
+        world_map = WorldMap.objects.get(pk=1)
+        render_map(world_map, 0, 0, 9, 9)
+        with self.assertNumQueries(0):
+            render_map(world_map, 0, 0, 9, 9)
+
+        map_square = MapSquare.objects.get(world_map=1, x=0, y=0)
+        map_square.terrain = Terrain.objects.get(name='Rocky')
+        map_square.save()
+        self.assertTrue(render_map(world_map, 0, 0, 9, 9).startswith('<a href="#" class="rocky"> @ </a>'))
+
+
+class TerrainStylesheetTest(TestCase):
+    fixtures = ['mapdata']
+
+    def test_stylesheet(self):
+        css, digest = get_terrain_stylesheet()
+        url = reverse('terrain_stylesheet', kwargs={'digest': digest})
+        response = self.client.get(url)
+        self.assertContains(response, 'a.grass {')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('max-age=31536000', response['Cache-Control'])
+
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_stylesheet_changes_with_terrain(self):
+        css, digest = get_terrain_stylesheet()
+        terrain = Terrain.objects.get(name='Grass')
+        terrain.fg_color = '123456'
+        terrain.save()
+        new_css, new_digest = get_terrain_stylesheet()
+        self.assertNotEqual(digest, new_digest)
+        self.assertIn('#123456', new_css)
+        self.assertRedirects(self.client.get(reverse('terrain_stylesheet', kwargs={'digest': digest})), reverse('terrain_stylesheet', kwargs={'digest': new_digest}))
+        # a browser revalidating its copy of the old stylesheet is sent on too, not told its copy is current.
+        self.assertRedirects(self.client.get(reverse('terrain_stylesheet', kwargs={'digest': digest}), HTTP_IF_NONE_MATCH='"{digest}"'.format(digest=digest)), reverse('terrain_stylesheet', kwargs={'digest': new_digest}))
+
+
+class GenerateWorldTest(TestCase):
+    fixtures = ['mapdata']
+
+    def test_generate_world(self):
+        world_map = generate_world('Generated', 30, 20, seed=1, safe_radius=1)
+        self.assertEqual(world_map.mapsquare_set.count(), 600)
+        self.assertTrue(world_map.start.terrain.passable)
+        self.assertEqual(world_map.mapsquare_set.filter(safe=True).count(), 9)
+        self.assertFalse(world_map.start.get_surrounding_squares().filter(safe=False).exists())
+
+    def test_command_rejects_empty_maps(self):
+        self.assertRaises(CommandError, call_command, 'generate_world', 'Flat', '0', '5')
+        Terrain.objects.all().delete()
+        self.assertRaises(CommandError, call_command, 'generate_world', 'Bare', '5', '5')
+        self.assertFalse(WorldMap.objects.filter(name__in=['Flat', 'Bare']).exists())
+
+    def test_same_seed_same_map(self):
+        first = generate_world('First', 12, 12, seed=7)
+        second = generate_world('Second', 12, 12, seed=7)
+        self.assertEqual(list(first.mapsquare_set.values_list('x', 'y', 'terrain', 'battle_odds')), list(second.mapsquare_set.values_list('x', 'y', 'terrain', 'battle_odds')))
+
+
+class MapFileTest(TestCase):
+    fixtures = ['mapdata']
+
+    def test_round_trip(self):
+        original = WorldMap.objects.get(pk=1)
+        original.start = original.mapsquare_set.get(x=4, y=4)
+        original.save()
+        original.mapsquare_set.filter(x=9, y=9).delete()
+
+        out = StringIO()
+        export_map(original, out)
+        imported = import_map(out.getvalue().splitlines(True), name='Copy')
+
+        self.assertEqual(imported.name, 'Copy')
+        self.assertEqual((imported.start.x, imported.start.y), (4, 4))
+        fields = ('x', 'y', 'terrain', 'battle_odds', 'safe')
+        self.assertEqual(list(imported.mapsquare_set.order_by('y', 'x').values_list(*fields)), list(original.mapsquare_set.order_by('y', 'x').values_list(*fields)))
+
+    def test_unknown_terrain(self):
+        lines = ['size: 2x1\n', 'map:\n', '`?\n']
+        self.assertRaises(MapFormatException, import_map, lines)
+
+
+class MapPaintTest(TestCase):
+    fixtures = ['mapdata', 'armor', 'weapon']
+
+    def setUp(self):
+        from players.models import Player
+        Player.objects.create_superuser('painter@example.com', 'Pain', 'Ter', 'painter', 'F', 'password')
+        self.client.login(email='painter@example.com', password='password')
+        self.world_map = WorldMap.objects.get(pk=1)
+        self.rocky = Terrain.objects.get(name='Rocky')
+
+    def test_paint_rectangle(self):
+        self.world_map.mapsquare_set.filter(x=1, y=1).delete()
+        started = now()
+        with self.assertNumQueries(3): # update, find the missing squares, insert them.
+            updated, created = self.world_map.paint([(x, y) for x in xrange(3) for y in xrange(2)], terrain=self.rocky, battle_odds=5)
+        self.assertEqual((updated, created), (5, 1))
+        painted = self.world_map.mapsquare_set.filter(x__lte=2, y__lte=1)
+        self.assertEqual(painted.filter(terrain=self.rocky, battle_odds=5).count(), 6)
+        self.assertEqual(painted.filter(modified_at__gte=started).count(), 6)
+
+    def test_paint_view(self):
+        get_grid(1)
+        response = self.client.post(reverse('world_map_paint', kwargs={'world_map_id': 1}), {'squares': '0,0;5,5', 'safe': '0'})
+        self.assertRedirects(response, reverse('world_map_edit', kwargs={'world_map_id': 1}))
+        self.assertEqual(self.world_map.mapsquare_set.filter(safe=False).count(), 2)
+        self.assertFalse(get_grid(1).safe[get_grid(1).index(5, 5)])
+
+    def test_paint_form_clamps_rectangle(self):
+        form = MapPaintForm(self.world_map, {'x_min': 8, 'y_min': 9, 'x_max': 32767, 'y_max': 32767})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['positions'], [(8, 9), (9, 9)])
+
+    def test_editor(self):
+        response = self.client.get(reverse('world_map_edit', kwargs={'world_map_id': 1}))
+        self.assertContains(response, 'id="paint_form"')
+
+
+class PathfindingTest(TestCase):
+    fixtures = ['mapdata']
+
+    def setUp(self):
+        invalidate_grid()
+        grass = Terrain.objects.get(name='Grass')
+        self.world_map = generate_world('Paths', 5, 3, seed=1, safe_radius=0)
+        self.world_map.paint([(x, y) for x in xrange(5) for y in xrange(3)], terrain=grass)
+
+    def test_straight_path(self):
+        directions, turns = find_path(get_grid(self.world_map.pk), (0, 1), (4, 1))
+        self.assertEqual(directions, ['E', 'E', 'E', 'E'])
+        self.assertEqual(turns, 4)
+
+    def test_path_avoids_impassable_and_slow_terrain(self):
+        self.world_map.paint([(2, 0), (2, 1)], terrain=Terrain.objects.get(name='Water'))
+        self.world_map.paint([(2, 2)], terrain=Terrain.objects.get(name='Rocky'))
+        directions, turns = find_path(get_grid(self.world_map.pk), (0, 1), (4, 1))
+        self.assertEqual(turns, 10) # around the water, through the rocks.
+
+        self.assertIsNone(find_path(get_grid(self.world_map.pk), (0, 1), (4, 1), max_cost=9))
+        self.world_map.paint([(2, 2)], terrain=Terrain.objects.get(name='Ocean'))
+        self.assertIsNone(find_path(get_grid(self.world_map.pk), (0, 1), (4, 1)))
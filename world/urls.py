@@ -3,5 +3,8 @@ from django.conf.urls import patterns, include, url
 # Uncomment the next two lines to enable the admin:
 urlpatterns = patterns('',
     url(r'^worldmap/(?P<world_map_id>[0-9]*)/main.html$', 'world.views.main', name='world_map_main'),
-    url(r'^worldmap/(?P<world_map_id>[0-9]*)/edit.html$', 'world.admin.world_map_editor', name="world_map_edit")
+    url(r'^worldmap/(?P<world_map_id>[0-9]*)/edit.html$', 'world.admin.world_map_editor', name="world_map_edit"),
+    url(r'^worldmap/(?P<world_map_id>[0-9]+)/paint.go$', 'world.admin.world_map_paint', name="world_map_paint"),
+    url(r'^worldmap/(?P<world_map_id>[0-9]+)/map-(?P<version>[0-9.]+).json$', 'world.views.map_data', name='world_map_data'),
+    url(r'^terrain-(?P<digest>[0-9a-f]+).css$', 'world.views.terrain_stylesheet', name='terrain_stylesheet'),
 )
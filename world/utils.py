@@ -0,0 +1,10 @@
+from itertools import islice
+
+def batches(iterable, size):
+    """Split any iterable into lists of at most size items without loading it all into memory."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -1,11 +1,16 @@
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render, render_to_response
+from django.utils.cache import patch_cache_control
 from django.utils.timezone import now
+from django.views.decorators.http import condition
 
+from .mapcache import cacheable, get_map_data, get_terrain_stylesheet, map_version, render_map
 from .models import *
 
-import datetime
+import datetime, json
 
 @login_required
 def home(request):
@@ -14,11 +19,57 @@ def home(request):
 @login_required
 def main(request, world_map_id):
     world_map = get_object_or_404(WorldMap, id=world_map_id)
-    terrain = Terrain.objects.all()
+    
+    map_square = request.user.map_square
+    viewport_radius = settings.MAP_VIEWPORT_RADIUS
+    if settings.MAP_RENDERER == 'canvas':
+        # the browser draws the map from the (cacheable) map data, so nothing map sized is rendered here.
+        map_data_url = reverse('world_map_data', kwargs={'world_map_id': world_map.pk, 'version': map_version(world_map.pk)})
+        players_in_view = json.dumps(request.user.players_in_view())
+    else:
+        # only render the squares around the player, unless the viewport has been turned off.
+        if viewport_radius is None:
+            bounds = (0, 0, world_map.x_size - 1, world_map.y_size - 1)
+        else:
+            bounds = world_map.viewport(map_square.x, map_square.y, viewport_radius)
+        map_html = render_map(world_map, *bounds, player_square=map_square)
     
     # if the plaeyr hasn't been active for over 10 minutes, announce that they logged on. 
-    if request.user.here_since < (now() - datetime.timedelta(minutes=10)):
+    if request.user.last_seen < (now() - datetime.timedelta(minutes=10)):
         request.user.map_square.announce_arrival(request.user, 'Ether')
-    request.user.here_since = now()
-    request.user.save(update_fields=['here_since',])
-    return render(request, 'world_map/main.html', locals())
\ No newline at end of file
+    if request.user.mark_active(): # most page views only touch the heartbeat cache.
+        request.user.save(update_fields=['here_since',])
+    return render(request, 'world_map/main.html', locals())
+
+def _terrain_stylesheet_etag(request, digest):
+    # no etag for an out of date digest, so the client's copy can't match and the view sends it on to the current one.
+    css, current_digest = get_terrain_stylesheet()
+    return digest if digest == current_digest else None
+
+@condition(etag_func=_terrain_stylesheet_etag)
+def terrain_stylesheet(request, digest):
+    css, current_digest = get_terrain_stylesheet()
+    if digest != current_digest: # terrain changed since the page was rendered.
+        return redirect(reverse('terrain_stylesheet', kwargs={'digest': current_digest}))
+    
+    response = HttpResponse(css, content_type='text/css')
+    patch_cache_control(response, public=True, max_age=60 * 60 * 24 * 365) # the url changes whenever the content does.
+    return response
+
+def _map_data_etag(request, world_map_id, version):
+    # as with the stylesheet, an out of date version gets no etag so the view can send the client on.
+    return version if version == map_version(int(world_map_id)) and cacheable(version) else None
+
+@login_required
+@condition(etag_func=_map_data_etag)
+def map_data(request, world_map_id, version):
+    current_version, data = get_map_data(int(world_map_id))
+    if version != current_version: # the map changed since the page was rendered.
+        return redirect(reverse('world_map_data', kwargs={'world_map_id': world_map_id, 'version': current_version}))
+    
+    response = HttpResponse(data, content_type='application/json')
+    if cacheable(current_version):
+        patch_cache_control(response, private=True, max_age=60 * 60 * 24 * 365) # the url changes whenever the content does.
+    else:
+        patch_cache_control(response, private=True, no_cache=True) # the cache is down, so the url doesn't.
+    return response